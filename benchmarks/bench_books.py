@@ -0,0 +1,110 @@
+"""Memory and access cost of book rows: asyncpg.Record vs books.Book.
+
+Fetches `--books` synthetic rows shaped like the bot's book queries
+(BOOK_COLUMNS + genre_name) straight from generate_series, then compares:
+fetch and decode time, memory per row, and the cost of formatting every
+row with rendering.format_book and of collecting the ids. Needs a reachable Postgres (DB_* env
+vars); no tables are touched.
+
+    python benchmarks/bench_books.py [--books 1000000]
+"""
+import argparse
+import asyncio
+import gc
+import sys
+import time
+
+import asyncpg
+
+import fixtures
+
+from books import Book, decode_books
+from rendering import format_book
+
+ROWS_SQL = """
+    SELECT i AS book_id, 'Book title number ' || i AS title, 'Author ' || (i % 50000) AS author,
+           1900 + i % 125 AS publication_year, CASE WHEN i % 7 > 0 THEN 1 + i % 5 END AS rating,
+           (ARRAY['Fiction', 'History', 'Self-Help', 'Science'])[1 + i % 4] AS genre_name
+    FROM generate_series(1, $1) AS i
+"""
+
+
+def format_record(book, with_genre: bool = True):
+    """rendering.format_book as it was written for Records, looking every field up by name."""
+    rating = book['rating']
+    if rating is None:
+        rating = "Unrated"
+    if with_genre:
+        return f"📖 *{book['title']}* by {book['author']} ({book['publication_year']}, {book['genre_name']}, Rating: {rating}/5)"
+    return f"📖 *{book['title']}* by {book['author']} ({book['publication_year']}, Rating: {rating}/5)"
+
+
+async def load(conn, count: int, decode: bool):
+    """(rows, seconds) for one fetch, optionally decoded to Books."""
+    gc.collect()
+    start = time.perf_counter()
+    rows = await conn.fetch(ROWS_SQL, count)
+    if decode:
+        rows = decode_books(rows)
+    return rows, time.perf_counter() - start
+
+
+def deep_size(rows):
+    """Bytes held by the row objects and their field values, shared objects counted once.
+
+    asyncpg allocates Records outside tracemalloc's view, so sizes are summed directly.
+    """
+    seen = set()
+    total = sys.getsizeof(rows)
+    for row in rows:
+        total += sys.getsizeof(row)
+        values = row.values() if isinstance(row, asyncpg.Record) else (getattr(row, name) for name in Book.__slots__)
+        for value in values:
+            if id(value) not in seen:
+                seen.add(id(value))
+                total += sys.getsizeof(value)
+    return total
+
+
+def per_row_ns(func, rows):
+    start = time.perf_counter()
+    func(rows)
+    return (time.perf_counter() - start) / len(rows) * 1e9
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=int, default=1_000_000)
+    args = parser.parse_args()
+    n = args.books
+
+    conn = await fixtures.connect()
+    try:
+        records, record_seconds = await load(conn, n, decode=False)
+        books, book_seconds = await load(conn, n, decode=True)
+    finally:
+        await conn.close()
+    del books
+    start = time.perf_counter()
+    books = decode_books(records)
+    decode_seconds = time.perf_counter() - start
+
+    rows = [
+        ("fetch (+ decode) s", f"{record_seconds:.2f}", f"{book_seconds:.2f}"),
+        ("decode ns/row", "", f"{decode_seconds / n * 1e9:.0f}"),
+        ("bytes/row", f"{deep_size(records) / n:.0f}", f"{deep_size(books) / n:.0f}"),
+        ("format_book ns/row",
+         f"{per_row_ns(lambda rs: [format_record(r) for r in rs], records):.0f}",
+         f"{per_row_ns(lambda bs: [format_book(b) for b in bs], books):.0f}"),
+        ("collect ids ns/row",
+         f"{per_row_ns(lambda rs: {r['book_id'] for r in rs}, records):.0f}",
+         f"{per_row_ns(lambda bs: {b.book_id for b in bs}, books):.0f}"),
+    ]
+    print(f"{n:,} rows")
+    print(f"{'':<22}{'Record':>12}{'Book':>12}")
+    for name, record_value, book_value in rows:
+        print(f"{name:<22}{record_value:>12}{book_value:>12}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""Offline rebuild time and serve-time lookup cost of the item-item recommender.
+
+The rebuild runs on synthetic Zipf-distributed interactions, no database
+needed. With --lookups, the last model is also published to a throwaway
+schema (DB_* env vars) and the serve-time query is timed against it.
+
+    python benchmarks/bench_recommender.py [--interactions 100000 1000000] [--users 50000] [--books 200000]
+                                           [--lookups 1000]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import numpy as np
+
+import fixtures
+
+import db
+import recommender
+from recommender import build_model
+
+SCHEMA = "bench_recommender"
+
+
+def synthetic(interactions: int, users: int, books: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    user_ids = rng.integers(1, users + 1, interactions)
+    book_ids = 1 + (rng.zipf(1.2, interactions) - 1) % books
+    weights = rng.choice([0.2, 0.4, 0.6, 0.8, 1.0], interactions)
+    return user_ids, book_ids, weights
+
+
+async def time_lookups(model, user_ids, book_ids, users: int, books: int, lookups: int):
+    conn = await fixtures.connect()
+    try:
+        await fixtures.create_schema(conn, SCHEMA)
+        await fixtures.seed_users(conn, users)
+        await fixtures.seed_books(conn, books)
+        # The synthetic interactions become the users' reading lists.
+        await conn.copy_records_to_table(
+            "readinglist", records=set(zip(user_ids.tolist(), book_ids.tolist())), columns=("user_id", "book_id")
+        )
+        await conn.execute("ANALYZE ReadingList")
+        await recommender.publish(conn, *model)
+
+        query = db.QUERIES["neighbor_recommendations"]
+        samples = []
+        for _ in range(lookups):
+            user_id = random.randint(1, users)
+            genre = random.choice(fixtures.GENRES)
+            start = time.perf_counter()
+            await conn.fetch(query, user_id, genre, recommender.HISTORY, recommender.TOP_N,
+                             recommender.READING_LIST_WEIGHT)
+            samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        print(f"  lookup p50 {statistics.median(samples):.3f} ms   p99 {samples[int(len(samples) * 0.99) - 1]:.3f} ms")
+    finally:
+        await fixtures.drop_schema(conn, SCHEMA)
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--interactions", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--books", type=int, default=200_000)
+    parser.add_argument("--lookups", type=int, default=0)
+    args = parser.parse_args()
+
+    for count in args.interactions:
+        user_ids, book_ids, weights = synthetic(count, args.users, args.books)
+        start = time.perf_counter()
+        model = build_model(user_ids, book_ids, weights)
+        build_seconds = time.perf_counter() - start
+        modelled = int((np.diff(model[1]) > 0).sum())
+        print(f"{count:>10,} interactions: rebuild {build_seconds:7.2f}s, {modelled:,} books with neighbors")
+
+    if args.lookups:
+        asyncio.run(time_lookups(model, user_ids, book_ids, args.users, args.books, args.lookups))
+
+
+if __name__ == "__main__":
+    main()
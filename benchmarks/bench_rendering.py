@@ -0,0 +1,56 @@
+"""Per-message render cost of the book list formatter at 1, 50 and 500 books.
+
+    python benchmarks/bench_rendering.py [--sizes 1 50 500] [--repeat 2000]
+"""
+import argparse
+import timeit
+
+import fixtures  # noqa: F401  (puts the bot modules on sys.path)
+
+from books import Book
+from rendering import render_books, book_actions_keyboard
+
+
+def make_books(count: int):
+    return [
+        Book(
+            book_id=i,
+            title=f"Book title number {i}",
+            author=f"Author {i % 97}",
+            publication_year=1900 + i % 125,
+            genre_name="Fiction",
+            rating=None if i % 7 == 0 else 1 + i % 5,
+        )
+        for i in range(count)
+    ]
+
+
+def legacy_render(books):
+    response = "Your books:\n\n"
+    for book in books:
+        rating = book.rating if book.rating is not None else "Unrated"
+        response += f"📖 *{book.title}* by {book.author} ({book.publication_year}, {book.genre_name}, Rating: {rating}/5)\n"
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        books = make_books(size)
+        cases = {
+            "legacy += concat": lambda: legacy_render(books),
+            "render_books": lambda: render_books("Your books:", books),
+            "book_actions_keyboard": lambda: book_actions_keyboard(books),
+        }
+        print(f"\n{size} books ({len(render_books('Your books:', books))} message(s))")
+        for name, func in cases.items():
+            per_call = min(timeit.repeat(func, number=args.repeat, repeat=5)) / args.repeat
+            print(f"  {name:<24} {per_call * 1e6:10.2f} µs/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Dispatch overhead per update: the old linear filter chain vs the routing tables.
+
+Both dispatchers use no-op handlers and in-memory FSM storage, so the
+numbers are aiogram's propagation plus filter evaluation and payload
+parsing only. No database or network needed.
+
+    python benchmarks/bench_routing.py [--iterations 20000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher, types  # noqa: E402
+from aiogram.filters import Command  # noqa: E402
+from aiogram.fsm.state import State, StatesGroup  # noqa: E402
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+
+from callbacks import AddReading, BooksPage, DeleteBook, ReadingListPage, SearchPage, UpdateBook, UpdateField  # noqa: E402
+from rendering import (  # noqa: E402
+    MENU_ADD_BOOK, MENU_MY_BOOKS, MENU_READING_LIST, MENU_RECOMMENDATIONS, MENU_STATS, MENU_SURPRISE,
+)
+from routing import CallbackRoutes, StateRoutes, TextRoutes  # noqa: E402
+
+MENU = (MENU_RECOMMENDATIONS, MENU_ADD_BOOK, MENU_MY_BOOKS, MENU_SURPRISE, MENU_READING_LIST, MENU_STATS)
+LEGACY_CALLBACK_PREFIXES = ("add_reading_", "books_", "rlist_", "search_", "delete_", "update_", "field_")
+CALLBACKS = (AddReading, BooksPage, ReadingListPage, SearchPage, DeleteBook, UpdateBook, UpdateField)
+
+
+class Form(StatesGroup):
+    title = State()
+    author = State()
+    genre = State()
+    year = State()
+    rating = State()
+    value = State()
+
+
+async def noop(*args, **kwargs):
+    pass
+
+
+def legacy_dispatcher():
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.message.register(noop, Command("start"))
+    dp.message.register(noop, Command("search"))
+    for text in MENU:
+        dp.message.register(noop, lambda message, text=text: message.text == text)
+    for state in Form.__states__:
+        dp.message.register(noop, state)
+    dp.message.register(noop)
+
+    async def parse_callback(callback: types.CallbackQuery):
+        callback.data.split("_")
+
+    for prefix in LEGACY_CALLBACK_PREFIXES:
+        dp.callback_query.register(parse_callback, lambda c, prefix=prefix: c.data.startswith(prefix))
+    return dp
+
+
+def routed_dispatcher():
+    dp = Dispatcher(storage=MemoryStorage())
+    menu, states, callbacks = TextRoutes(), StateRoutes(), CallbackRoutes()
+    for text in MENU:
+        menu.route(text)(noop)
+    for state in Form.__states__:
+        states.route(state)(noop)
+    for factory in CALLBACKS:
+        callbacks.route(factory)(noop)
+
+    async def dispatch(event, route, **kwargs):
+        await route(event)
+
+    dp.message.register(noop, Command("start"))
+    dp.message.register(noop, Command("search"))
+    dp.message.register(dispatch, menu)
+    dp.message.register(dispatch, states)
+    dp.message.register(noop)
+    dp.callback_query.register(dispatch, callbacks)
+    dp.callback_query.register(noop)
+    return dp
+
+
+def message_update(bot, text: str):
+    return types.Update.model_validate({"update_id": 1, "message": {
+        "message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "Bench"}, "text": text,
+    }}, context={"bot": bot})
+
+
+def callback_update(bot, data: str):
+    return types.Update.model_validate({"update_id": 1, "callback_query": {
+        "id": "1", "chat_instance": "1", "data": data,
+        "from": {"id": 1, "is_bot": False, "first_name": "Bench"},
+    }}, context={"bot": bot})
+
+
+async def per_update_us(dp, bot, update, iterations: int, state=None):
+    key = StorageKey(bot_id=bot.id, chat_id=1, user_id=1)
+    await dp.storage.set_state(key, state)
+    for _ in range(100):
+        await dp.feed_update(bot, update)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - start) * 1e6 / iterations
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20_000)
+    args = parser.parse_args()
+
+    bot = Bot(token="123456:bench")
+    legacy, routed = legacy_dispatcher(), routed_dispatcher()
+    cases = [
+        ("first menu button", message_update(bot, MENU[0]), message_update(bot, MENU[0]), None),
+        ("last menu button", message_update(bot, MENU[-1]), message_update(bot, MENU[-1]), None),
+        ("form state text", message_update(bot, "Dune"), message_update(bot, "Dune"), Form.value),
+        ("free text fallback", message_update(bot, "Fiction"), message_update(bot, "Fiction"), None),
+        ("last callback", callback_update(bot, "field_title"),
+         callback_update(bot, UpdateField(field="title").pack()), None),
+    ]
+    print(f"{'case':<22}{'linear chain':>16}{'route tables':>16}")
+    for name, legacy_update, routed_update, state in cases:
+        before = await per_update_us(legacy, bot, legacy_update, args.iterations, state)
+        after = await per_update_us(routed, bot, routed_update, args.iterations, state)
+        print(f"{name:<22}{before:>13.1f} us{after:>13.1f} us")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
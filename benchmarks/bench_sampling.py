@@ -0,0 +1,77 @@
+"""Compare GenreSampler picks against ORDER BY RANDOM() at several catalog sizes.
+
+Needs a reachable Postgres (DB_* env vars); works in a throwaway schema.
+
+    python benchmarks/bench_sampling.py [--sizes 10000 100000 1000000] [--iterations 200]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import fixtures
+
+import db
+from sampling import GenreSampler
+
+SCHEMA = "bench_sampling"
+
+
+async def timed(coro_factory, iterations: int):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await coro_factory()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+async def bench_size(size: int, iterations: int):
+    conn = await fixtures.connect()
+    try:
+        await fixtures.create_schema(conn, SCHEMA)
+        await fixtures.seed_books(conn, size)
+    finally:
+        await conn.close()
+
+    await db.create_pool(server_settings={"search_path": SCHEMA})
+    try:
+        sampler = GenreSampler()
+        start = time.perf_counter()
+        await sampler.refresh(full=True)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        genre = fixtures.GENRES[0]
+        results = {
+            "ORDER BY RANDOM() genre": await timed(lambda: db.fetch("books_by_genre", genre, 3), iterations),
+            "sampler genre": await timed(lambda: sampler.sample(genre, 3), iterations),
+            "ORDER BY RANDOM() any": await timed(lambda: db.fetchrow("random_book"), iterations),
+            "sampler any": await timed(sampler.sample_any, iterations),
+        }
+    finally:
+        await db.close_pool()
+
+    print(f"\n{size:,} books (sampler full load {load_ms:.1f} ms)")
+    for name, (p50, p95) in results.items():
+        print(f"  {name:<26} p50 {p50:8.3f} ms   p95 {p95:8.3f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    try:
+        for size in args.sizes:
+            await bench_size(size, args.iterations)
+    finally:
+        conn = await fixtures.connect()
+        try:
+            await fixtures.drop_schema(conn, SCHEMA)
+        finally:
+            await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
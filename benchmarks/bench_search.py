@@ -0,0 +1,123 @@
+"""Book search latency: legacy-style ILIKE scan vs the tsvector GIN query (and trigram if available).
+
+Needs a reachable Postgres (DB_* env vars); works in a throwaway schema.
+
+    python benchmarks/bench_search.py [--books 1000000] [--iterations 200]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import fixtures
+
+import db
+from search import FUZZY_SEARCH_SQL, SEARCH_MAX_RESULTS, BookSearch, normalize_query, prefix_tsquery
+
+SCHEMA = "bench_search"
+
+WORDS = (
+    "shadow river winter garden silent empire broken crown golden city lost letters night storm glass house "
+    "iron road hidden kingdom last summer paper moon secret island burning sky forgotten song wild heart "
+    "distant shore dark forest ancient stone bright morning hollow hills quiet war red harvest blue ocean "
+    "fallen star little prince cold mountain long journey white tower endless sea"
+).split()
+FIRST_NAMES = "anna boris clara daniel elena frank grace henry iris jonas karen leo maria nikolai olga peter".split()
+LAST_NAMES = "adams brown carter dumas evans fischer garcia herbert ivanova jensen kowalski lopez murray".split()
+
+ILIKE_SQL = f"""
+    SELECT {db.BOOK_COLUMNS}, g.genre_name
+    FROM Books b
+    LEFT JOIN Genres g ON b.genre_id = g.genre_id
+    WHERE b.title ILIKE '%' || $1 || '%' OR b.author ILIKE '%' || $1 || '%'
+    ORDER BY b.book_id
+    LIMIT $2
+"""
+
+
+async def seed_catalog(conn, count: int):
+    await conn.execute("""
+        INSERT INTO Books (title, author, genre_id, publication_year, rating)
+        SELECT
+            initcap(w[1 + i % n] || ' ' || w[1 + (i / n) % n] || ' ' || w[1 + (i / (n * n)) % n]) || ' ' || i,
+            initcap(f[1 + (i * 7) % array_length(f, 1)] || ' ' || l[1 + (i * 13) % array_length(l, 1)]),
+            1 + (i % 8),
+            1900 + (i % 125),
+            1 + (i % 5)
+        FROM generate_series(1, $1) AS i,
+             (SELECT $2::text[] AS w, array_length($2::text[], 1) AS n, $3::text[] AS f, $4::text[] AS l) words
+    """, count, list(WORDS), list(FIRST_NAMES), list(LAST_NAMES))
+    await conn.execute("ANALYZE Books")
+
+
+def sample_queries(count: int):
+    rng = random.Random(42)
+    queries = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(" ".join(rng.sample(WORDS, 2)))
+        elif kind < 0.7:
+            queries.append(f"{rng.choice(WORDS)} {rng.choice(LAST_NAMES)}")
+        else:
+            queries.append(rng.choice(WORDS)[:4])
+    return queries
+
+
+async def timed(conn, sql: str, params, iterations: int):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        await conn.fetch(sql, params[i % len(params)], SEARCH_MAX_RESULTS)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+async def timed_cache(queries, iterations: int):
+    """In-process cache hit path: what repeated pages and inline keystrokes cost."""
+    search = BookSearch()
+    for query in queries:
+        search._remember(query, [])
+    start = time.perf_counter()
+    for i in range(iterations):
+        await search.page(queries[i % len(queries)], 0, 5)
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=int, default=1_000_000)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    conn = await fixtures.connect()
+    try:
+        await fixtures.create_schema(conn, SCHEMA)
+        start = time.perf_counter()
+        await seed_catalog(conn, args.books)
+        print(f"Seeded {args.books:,} books (with search indexes) in {time.perf_counter() - start:.1f}s")
+
+        queries = sample_queries(args.iterations)
+        normalized = [normalize_query(query) for query in queries]
+        tsqueries = [prefix_tsquery(query) for query in normalized]
+        fuzzy = await conn.fetchval("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+
+        legacy = await timed(conn, ILIKE_SQL, normalized, args.iterations)
+        fulltext = await timed(conn, db.QUERIES["search_books"], tsqueries, args.iterations)
+        print(f"  ILIKE scan        p50 {legacy[0]:8.3f} ms   p99 {legacy[1]:8.3f} ms")
+        print(f"  tsvector GIN      p50 {fulltext[0]:8.3f} ms   p99 {fulltext[1]:8.3f} ms")
+        if fuzzy:
+            trigram = await timed(conn, FUZZY_SEARCH_SQL, normalized, args.iterations)
+            print(f"  trigram (fuzzy)   p50 {trigram[0]:8.3f} ms   p99 {trigram[1]:8.3f} ms")
+        else:
+            print("  trigram (fuzzy)   skipped, pg_trgm not installed")
+        print(f"  LRU cache hit     {await timed_cache(normalized, args.iterations * 100) * 1000:8.3f} us")
+    finally:
+        await fixtures.drop_schema(conn, SCHEMA)
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
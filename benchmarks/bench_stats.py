@@ -0,0 +1,66 @@
+"""My Stats latency: legacy COUNT(*) subqueries vs the user_stats counter lookup.
+
+Needs a reachable Postgres (DB_* env vars); works in a throwaway schema.
+
+    python benchmarks/bench_stats.py [--recommendations 10000000] [--users 10000] [--iterations 200]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import fixtures
+
+import db
+
+SCHEMA = "bench_stats"
+
+LEGACY_STATS_SQL = """
+    SELECT
+        (SELECT COUNT(*) FROM Books WHERE user_id = $1) as books_added,
+        (SELECT COUNT(*) FROM Recommendations WHERE user_id = $1) as recommendations_received,
+        (SELECT COUNT(*) FROM ReadingList WHERE user_id = $1) as reading_list_count
+"""
+
+
+async def timed(conn, sql: str, users: int, iterations: int):
+    samples = []
+    for _ in range(iterations):
+        user_id = random.randint(1, users)
+        start = time.perf_counter()
+        await conn.fetchrow(sql, user_id)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recommendations", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    conn = await fixtures.connect()
+    try:
+        await fixtures.create_schema(conn, SCHEMA)
+        start = time.perf_counter()
+        await fixtures.seed_users(conn, args.users)
+        await fixtures.seed_books(conn, args.books, users=args.users)
+        await fixtures.seed_recommendations(conn, args.recommendations, args.users, args.books)
+        await fixtures.seed_reading_list(conn, 20, args.users, args.books)
+        print(f"Seeded {args.recommendations:,} recommendations in {time.perf_counter() - start:.1f}s")
+
+        legacy = await timed(conn, LEGACY_STATS_SQL, args.users, args.iterations)
+        counters = await timed(conn, db.QUERIES["user_stats"], args.users, args.iterations)
+        print(f"  legacy COUNT(*)   p50 {legacy[0]:8.3f} ms   p99 {legacy[1]:8.3f} ms")
+        print(f"  user_stats lookup p50 {counters[0]:8.3f} ms   p99 {counters[1]:8.3f} ms")
+    finally:
+        await fixtures.drop_schema(conn, SCHEMA)
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+"""A local stand-in for the Telegram Bot API, so load tests never leave the machine.
+
+Answers every method with a minimal valid result after an optional delay
+that models Telegram's round trip, and counts calls per method.
+"""
+import asyncio
+import itertools
+import time
+from collections import Counter
+
+from aiohttp import web
+
+# Methods whose result aiogram parses as a Message; everything else gets `true`.
+MESSAGE_METHODS = {"sendmessage", "editmessagetext", "editmessagereplymarkup"}
+
+
+class FakeTelegramAPI:
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.host = host
+        self.port = port
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+        self._runner = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def handle(self, request: web.Request):
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        form = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method not in MESSAGE_METHODS:
+            return web.json_response({"ok": True, "result": True})
+        chat_id = int(form.get("chat_id") or 0)
+        message_id = int(form.get("message_id") or next(self._message_ids))
+        return web.json_response({"ok": True, "result": {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": form.get("text", ""),
+        }})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
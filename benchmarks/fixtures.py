@@ -0,0 +1,75 @@
+import os
+import sys
+
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import DB_CONFIG  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+GENRES = ("Fiction", "History", "Self-Help", "Science", "Poetry", "Biography", "Fantasy", "Mystery")
+
+
+async def connect():
+    return await asyncpg.connect(**DB_CONFIG)
+
+
+async def create_schema(conn, schema: str):
+    """Recreate `schema` with the bot tables and make it the connection's search_path."""
+    await conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    await conn.execute(f"CREATE SCHEMA {schema}")
+    await conn.execute(f"SET search_path TO {schema}")
+    await migrate(conn)
+    # The migrations seed a few of these already; add the rest in order so genre ids stay 1..len(GENRES).
+    await conn.execute("""
+        INSERT INTO Genres (genre_name)
+        SELECT name FROM unnest($1::text[]) WITH ORDINALITY AS g (name, position)
+        WHERE name NOT IN (SELECT genre_name FROM Genres)
+        ORDER BY position
+    """, list(GENRES))
+
+
+async def seed_users(conn, count: int):
+    await conn.execute("""
+        INSERT INTO Users (user_id, username)
+        SELECT i, 'user_' || i FROM generate_series(1, $1) AS i
+    """, count)
+
+
+async def seed_books(conn, count: int, users: int = 0):
+    await conn.execute("""
+        INSERT INTO Books (title, author, genre_id, publication_year, user_id, rating)
+        SELECT
+            'Book ' || i,
+            'Author ' || (i % 50000),
+            1 + (i % $2),
+            1900 + (i % 125),
+            CASE WHEN $3 > 0 THEN 1 + (i % $3) END,
+            1 + (i % 5)
+        FROM generate_series(1, $1) AS i
+    """, count, len(GENRES), users)
+    await conn.execute("ANALYZE Books")
+
+
+async def drop_schema(conn, schema: str):
+    await conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+
+
+async def seed_recommendations(conn, count: int, users: int, books: int):
+    await conn.execute("""
+        INSERT INTO Recommendations (user_id, book_id)
+        SELECT 1 + (i % $2), 1 + (i % $3)
+        FROM generate_series(1, $1) AS i
+    """, count, users, books)
+    await conn.execute("ANALYZE Recommendations")
+
+
+async def seed_reading_list(conn, per_user: int, users: int, books: int):
+    await conn.execute("""
+        INSERT INTO ReadingList (user_id, book_id)
+        SELECT u, 1 + ((u * 7919 + j) % $3)
+        FROM generate_series(1, $2) AS u, generate_series(1, $1) AS j
+        ON CONFLICT DO NOTHING
+    """, per_user, users, books)
+    await conn.execute("ANALYZE ReadingList")
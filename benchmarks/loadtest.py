@@ -0,0 +1,307 @@
+"""End-to-end load test: replay synthetic Telegram updates through the bot's real Dispatcher.
+
+Seeds a throwaway schema, starts a fake Bot API server on localhost and
+feeds user sessions (menu taps, genre picks, searches, add-book flows,
+callback presses) through `dp.feed_update` with `--concurrency` sessions in
+flight. Updates within a session run in order, so FSM flows behave as in
+production. Needs a reachable Postgres (DB_* env vars).
+
+    python benchmarks/loadtest.py [--users 1000] [--books 100000] [--sessions 2000] [--concurrency 50]
+                                  [--api-latency-ms 0] [--output results.json] [--compare baseline.json]
+
+Results (per-handler p50/p95/p99 and updates/s, plus the run config and git
+commit) are written as JSON, by default to benchmarks/results/.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import fixtures
+from fake_telegram import FakeTelegramAPI
+
+os.environ.setdefault("BOT_TOKEN", "123456:loadtest")
+os.environ.setdefault("METRICS_PORT", "0")
+# The fake API has no flood limits; export SEND_GLOBAL_RATE/SEND_CHAT_RATE to replay with Telegram's.
+os.environ.setdefault("SEND_GLOBAL_RATE", "1000000")
+os.environ.setdefault("SEND_CHAT_RATE", "1000000")
+
+from aiogram import BaseMiddleware, types  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+
+import book_recommendation_bot as app  # noqa: E402
+from callbacks import AddReading, BooksPage, ReadingListPage  # noqa: E402
+import db  # noqa: E402
+import metrics  # noqa: E402
+from rendering import (  # noqa: E402
+    MENU_ADD_BOOK, MENU_MY_BOOKS, MENU_READING_LIST, MENU_RECOMMENDATIONS, MENU_STATS, MENU_SURPRISE,
+)
+
+SCHEMA = "bench_load"
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+SEARCH_TERMS = ("book", "author 12", "book 99", "author", "book 1234", "nothing matches this")
+
+# Relative frequency of each session kind; a session is one user's short burst of updates.
+SESSION_WEIGHTS = {
+    "recommendations": 30,
+    "surprise": 15,
+    "my_books": 10,
+    "reading_list": 10,
+    "stats": 10,
+    "search": 10,
+    "add_book": 10,
+    "start": 5,
+}
+
+
+class UpdateFactory:
+    def __init__(self, users: int, books: int, seed: int):
+        self.users = users
+        self.books = books
+        self.rng = random.Random(seed)
+        self.update_id = 0
+        self.message_id = 0
+
+    def _user(self, user_id: int):
+        return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user_{user_id}"}
+
+    def _message(self, user_id: int, text: str):
+        self.message_id += 1
+        return {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text,
+        }
+
+    def message(self, user_id: int, text: str):
+        self.update_id += 1
+        return {"update_id": self.update_id, "message": self._message(user_id, text)}
+
+    def callback(self, user_id: int, data: str):
+        self.update_id += 1
+        return {"update_id": self.update_id, "callback_query": {
+            "id": str(self.update_id),
+            "from": self._user(user_id),
+            "chat_instance": str(user_id),
+            "message": self._message(user_id, "previous reply"),
+            "data": data,
+        }}
+
+    def session(self, kind: str):
+        rng = self.rng
+        user_id = rng.randint(1, self.users)
+        book_id = rng.randint(1, self.books)
+        if kind == "recommendations":
+            return [
+                self.message(user_id, MENU_RECOMMENDATIONS),
+                self.message(user_id, rng.choice(fixtures.GENRES)),
+                self.callback(user_id, AddReading(book_id=book_id).pack()),
+            ]
+        if kind == "surprise":
+            return [self.message(user_id, MENU_SURPRISE), self.callback(user_id, AddReading(book_id=book_id).pack())]
+        if kind == "my_books":
+            return [
+                self.message(user_id, MENU_MY_BOOKS),
+                self.callback(user_id, BooksPage(backward=False, cursor=0).pack()),
+            ]
+        if kind == "reading_list":
+            return [
+                self.message(user_id, MENU_READING_LIST),
+                self.callback(user_id, ReadingListPage(backward=False, cursor=0).pack()),
+            ]
+        if kind == "stats":
+            return [self.message(user_id, MENU_STATS)]
+        if kind == "search":
+            return [self.message(user_id, f"/search {rng.choice(SEARCH_TERMS)}")]
+        if kind == "add_book":
+            return [
+                self.message(user_id, MENU_ADD_BOOK),
+                self.message(user_id, f"Load Test Book {self.update_id}"),
+                self.message(user_id, f"Load Test Author {user_id}"),
+                self.message(user_id, rng.choice(fixtures.GENRES)),
+                self.message(user_id, str(rng.randint(1900, 2024))),
+                self.message(user_id, str(rng.randint(1, 5))),
+            ]
+        return [self.message(user_id, "/start")]
+
+    def sessions(self, count: int):
+        kinds, weights = zip(*SESSION_WEIGHTS.items())
+        return [self.session(kind) for kind in self.rng.choices(kinds, weights, k=count)]
+
+
+def session_user(session):
+    event = session[0].get("message") or session[0]["callback_query"]
+    return event["from"]["id"]
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Records which handler served each update so end-to-end latency can be grouped by it."""
+
+    def __init__(self):
+        self.served_by = {}
+
+    async def __call__(self, handler, event, data):
+        self.served_by[data["event_update"].update_id] = metrics.handler_name(data)
+        return await handler(event, data)
+
+
+def percentile(samples, fraction: float):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def summarize(samples, elapsed: float):
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "updates_per_second": round(len(samples) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": round(percentile(samples, 0.50), 3),
+        "p95_ms": round(percentile(samples, 0.95), 3),
+        "p99_ms": round(percentile(samples, 0.99), 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def seed(args):
+    conn = await fixtures.connect()
+    try:
+        await fixtures.create_schema(conn, SCHEMA)
+        start = time.perf_counter()
+        await fixtures.seed_users(conn, args.users)
+        await fixtures.seed_books(conn, args.books, users=args.users)
+        await fixtures.seed_recommendations(conn, args.books * 2, args.users, args.books)
+        await fixtures.seed_reading_list(conn, 20, args.users, args.books)
+        print(f"Seeded {args.users:,} users and {args.books:,} books in {time.perf_counter() - start:.1f}s")
+    finally:
+        await conn.close()
+
+
+async def replay(sessions, concurrency: int, middleware: HandlerNameMiddleware):
+    latencies = defaultdict(list)
+    errors = 0
+    bot = app.get_bot()
+    queue = asyncio.Queue()
+    for session in sessions:
+        queue.put_nowait(session)
+
+    # A real user cannot run two flows at once; interleaving them would corrupt each other's form state.
+    user_locks = defaultdict(asyncio.Lock)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            session = queue.get_nowait()
+            async with user_locks[session_user(session)]:
+                await run_session(session)
+
+    async def run_session(session):
+        nonlocal errors
+        for raw in session:
+            update = types.Update.model_validate(raw, context={"bot": bot})
+            start = time.perf_counter()
+            try:
+                # One task per update, as aiogram's polling does; per-update state such as
+                # the FSM cache is scoped to that task and must not carry across updates.
+                await asyncio.create_task(app.dp.feed_update(bot, update))
+            except Exception:
+                errors += 1
+            elapsed = (time.perf_counter() - start) * 1000
+            latencies[middleware.served_by.pop(update.update_id, "unhandled")].append(elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def print_report(results, baseline=None):
+    base_handlers = (baseline or {}).get("handlers", {})
+    print(f"{'handler':<28}{'count':>8}{'upd/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = [("TOTAL", results["total"], (baseline or {}).get("total"))]
+    rows += [(name, stats, base_handlers.get(name)) for name, stats in sorted(results["handlers"].items())]
+    for name, stats, base in rows:
+        line = (f"{name:<28}{stats['count']:>8}{stats['updates_per_second']:>10}"
+                f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+        if base:
+            line += f"   p95 {(stats['p95_ms'] - base['p95_ms']) / base['p95_ms'] * 100:+.1f}% vs baseline"
+        print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--api-latency-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    parser.add_argument("--compare", help="previous results JSON to diff against")
+    parser.add_argument("--keep-schema", action="store_true")
+    args = parser.parse_args()
+
+    await seed(args)
+    api = await FakeTelegramAPI(latency=args.api_latency_ms / 1000).start()
+    app.get_bot().session.api = TelegramAPIServer.from_base(api.base_url)
+    middleware = HandlerNameMiddleware()
+    for observer in (app.dp.message, app.dp.callback_query):
+        observer.middleware(middleware)
+
+    await db.create_pool(server_settings={"search_path": SCHEMA}, max_size=max(10, args.concurrency // 2))
+    await app.startup(init_schema=False, metrics_port=0)
+    try:
+        sessions = UpdateFactory(args.users, args.books, args.seed).sessions(args.sessions)
+        latencies, errors, elapsed = await replay(sessions, args.concurrency, middleware)
+    finally:
+        await app.shutdown()
+        await api.stop()
+        if not args.keep_schema:
+            conn = await fixtures.connect()
+            try:
+                await fixtures.drop_schema(conn, SCHEMA)
+            finally:
+                await conn.close()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "elapsed_seconds": round(elapsed, 3),
+        "errors": errors,
+        "api_calls": dict(api.calls),
+        "total": summarize([sample for samples in latencies.values() for sample in samples], elapsed),
+        "handlers": {name: summarize(samples, elapsed) for name, samples in latencies.items()},
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    print(f"{errors} errors, {sum(api.calls.values())} Bot API calls in {elapsed:.2f}s")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"loadtest-{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,32 +1,88 @@
+import argparse
 import asyncio
 import logging
+import multiprocessing
 import random
+import signal
+import time
+from functools import partial
 from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.memory import MemoryStorage
 import asyncpg
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 
+import db
+from callbacks import AddReading, BooksPage, DeleteBook, ReadingListPage, SearchPage, UpdateBook, UpdateField
+from db import DB_CONFIG
+from fsm_storage import PostgresStorage
+from genre_cache import GenreCache
+import metrics
+from migrations import migrate
+from outbox import SendScheduler
+from rendering import (
+    MAIN_MENU, UPDATE_FIELDS_KEYBOARD, MENU_RECOMMENDATIONS, MENU_ADD_BOOK, MENU_MY_BOOKS, MENU_SURPRISE,
+    MENU_READING_LIST, MENU_STATS, escape_markdown, format_book, render_books, render_page, render_stats,
+    reading_list_keyboard, surprise_keyboard, book_actions_keyboard, pagination_row, pagination_keyboard, page_row,
+    search_keyboard,
+)
+import recommender
+from routing import CallbackRoutes, StateRoutes, TextRoutes
+from sampling import GenreSampler
+from search import BookSearch, normalize_query
+from seen import SEEN_WORKER_REFRESH, SeenTracker
+from stats import RECONCILE_INTERVAL, run_reconciler
+from user_cache import UserCache
+import webhook
+from write_buffer import RecommendationWriter
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "database": os.getenv("DB_NAME", "book_bot"),
-    "user": os.getenv("DB_USER", "postgres"),
-    "password": os.getenv("DB_PASSWORD", "your_password"),
-    "port": os.getenv("DB_PORT", "5432")
-}
-
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "10"))
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "5"))
+INLINE_PAGE_SIZE = int(os.getenv("INLINE_PAGE_SIZE", "20"))
+FSM_STORAGE = os.getenv("FSM_STORAGE", "postgres")
+
+_bot = None
+fsm_storage = PostgresStorage() if FSM_STORAGE == "postgres" else MemoryStorage()
+dp = Dispatcher(storage=fsm_storage)
+genre_cache = GenreCache()
+genre_sampler = GenreSampler()
+seen_books = SeenTracker()
+user_cache = UserCache()
+# Recommendations only move the received counter in My Stats.
+recommendation_writer = RecommendationWriter(
+    on_flush=lambda user_ids: user_cache.invalidate(*user_ids, names=("stats",))
+)
+book_search = BookSearch()
+outbox = SendScheduler(None)
+menu_routes = TextRoutes()
+state_routes = StateRoutes()
+callback_routes = CallbackRoutes()
+
+metrics.instrument(dp)
+metrics.register_gauges("bot_db_pool", db.pool_metrics)
+metrics.register_gauges("bot_recommendation_writer", recommendation_writer.metrics)
+metrics.register_gauges("bot_search", book_search.metrics)
+metrics.register_gauges("bot_outbox", outbox.metrics)
+metrics.register_gauges("bot_user_cache", user_cache.metrics)
+
+def get_bot():
+    """The Bot, built on first use so importing this module needs neither a token nor a session."""
+    global _bot
+    if _bot is None:
+        _bot = Bot(token=BOT_TOKEN)
+        metrics.instrument_bot(_bot)
+        outbox.bot = _bot
+    return _bot
 
 class AddBookForm(StatesGroup):
     title = State()
@@ -41,500 +97,559 @@ class UpdateBookForm(StatesGroup):
     value = State()
 
 async def init_db():
+    """Bring the schema (and seed data) up to date; one version query when it already is.
+
+    Runs on its own connection: pooled ones carry DB_COMMAND_TIMEOUT, which
+    would cancel index builds and the advisory lock wait on large catalogs.
+    """
     conn = await asyncpg.connect(**DB_CONFIG)
     try:
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS Users (
-                user_id BIGINT PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE IF NOT EXISTS Genres (
-                genre_id SERIAL PRIMARY KEY,
-                genre_name TEXT UNIQUE NOT NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS Books (
-                book_id SERIAL PRIMARY KEY,
-                title TEXT NOT NULL,
-                author TEXT NOT NULL,
-                genre_id INTEGER REFERENCES Genres(genre_id),
-                publication_year INTEGER,
-                user_id BIGINT REFERENCES Users(user_id),
-                rating INTEGER CHECK (rating >= 1 AND rating <= 5),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE IF NOT EXISTS Recommendations (
-                recommendation_id SERIAL PRIMARY KEY,
-                user_id BIGINT REFERENCES Users(user_id),
-                book_id INTEGER REFERENCES Books(book_id),
-                recommended_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE IF NOT EXISTS ReadingList (
-                reading_list_id SERIAL PRIMARY KEY,
-                user_id BIGINT REFERENCES Users(user_id),
-                book_id INTEGER REFERENCES Books(book_id),
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-
-        await conn.execute("""
-            DO $$ 
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'books' AND column_name = 'user_id'
-                ) THEN
-                    ALTER TABLE Books ADD COLUMN user_id BIGINT REFERENCES Users(user_id);
-                END IF;
-                IF NOT EXISTS (
-                    SELECT 1 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'books' AND column_name = 'rating'
-                ) THEN
-                    ALTER TABLE Books ADD COLUMN rating INTEGER CHECK (rating >= 1 AND rating <= 5);
-                END IF;
-            END $$;
-        """)
-
-        await conn.execute("""
-            INSERT INTO Genres (genre_name)
-            VALUES ('Fiction'), ('History'), ('Self-Help')
-            ON CONFLICT (genre_name) DO NOTHING;
-        """)
-
-        await conn.execute("""
-            INSERT INTO Books (title, author, genre_id, publication_year, user_id, rating)
-            VALUES
-                ('1984', 'George Orwell', (SELECT genre_id FROM Genres WHERE genre_name = 'Fiction'), 1949, NULL, 5),
-                ('Pride and Prejudice', 'Jane Austen', (SELECT genre_id FROM Genres WHERE genre_name = 'Fiction'), 1813, NULL, 4),
-                ('Dune', 'Frank Herbert', (SELECT genre_id FROM Genres WHERE genre_name = 'Fiction'), 1965, NULL, 5),
-                ('Sapiens', 'Yuval Noah Harari', (SELECT genre_id FROM Genres WHERE genre_name = 'History'), 2011, NULL, 4),
-                ('The Guns of August', 'Barbara W. Tuchman', (SELECT genre_id FROM Genres WHERE genre_name = 'History'), 1962, NULL, 3),
-                ('A People''s History of the United States', 'Howard Zinn', (SELECT genre_id FROM Genres WHERE genre_name = 'History'), 1980, NULL, 4),
-                ('Atomic Habits', 'James Clear', (SELECT genre_id FROM Genres WHERE genre_name = 'Self-Help'), 2018, NULL, 5),
-                ('The Power of Now', 'Eckhart Tolle', (SELECT genre_id FROM Genres WHERE genre_name = 'Self-Help'), 1997, NULL, 4),
-                ('Mindset', 'Carol S. Dweck', (SELECT genre_id FROM Genres WHERE genre_name = 'Self-Help'), 2006, NULL, 3)
-            ON CONFLICT DO NOTHING;
-        """)
-        logger.info("Database initialized successfully")
+        version = await migrate(conn)
+        logger.info(f"Database schema at version {version}")
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
         raise
     finally:
         await conn.close()
 
-async def get_main_menu():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📚 Get Recommendations"), KeyboardButton(text="➕ Add Book")],
-            [KeyboardButton(text="📖 My Books"), KeyboardButton(text="⭐ Surprise Me!")],
-            [KeyboardButton(text="📋 My Reading List"), KeyboardButton(text="📊 My Stats")]
-        ],
-        resize_keyboard=True
-    )
-    return keyboard
-
 async def get_genre_keyboard():
-    conn = await asyncpg.connect(**DB_CONFIG)
-    try:
-        genres = await conn.fetch("SELECT genre_name FROM Genres")
-        keyboard_buttons = [[KeyboardButton(text=genre['genre_name'])] for genre in genres]
-        keyboard = ReplyKeyboardMarkup(keyboard=keyboard_buttons, resize_keyboard=True)
-        return keyboard
-    finally:
-        await conn.close()
+    return await genre_cache.keyboard()
 
 async def register_user(user: types.User):
-    conn = await asyncpg.connect(**DB_CONFIG)
-    try:
-        await conn.execute("""
-            INSERT INTO Users (user_id, username, first_name, last_name, created_at)
-            VALUES ($1, $2, $3, $4, $5)
-            ON CONFLICT (user_id) DO NOTHING
-        """, user.id, user.username, user.first_name, user.last_name, datetime.now())
-    finally:
-        await conn.close()
-
-async def get_book_recommendations(genre_name: str, limit: int = 3):
-    conn = await asyncpg.connect(**DB_CONFIG)
-    try:
-        books = await conn.fetch("""
-            SELECT b.book_id, b.title, b.author, b.publication_year, b.rating
-            FROM Books b
-            JOIN Genres g ON b.genre_id = g.genre_id
-            WHERE g.genre_name = $1
-            ORDER BY RANDOM()
-            LIMIT $2
-        """, genre_name, limit)
-        return books
-    finally:
-        await conn.close()
-
-async def get_random_book():
-    conn = await asyncpg.connect(**DB_CONFIG)
-    try:
-        book = await conn.fetchrow("""
-            SELECT b.book_id, b.title, b.author, b.publication_year, b.rating, g.genre_name
-            FROM Books b
-            JOIN Genres g ON b.genre_id = g.genre_id
-            ORDER BY RANDOM()
-            LIMIT 1
-        """)
-        return book
-    finally:
-        await conn.close()
+    await db.execute("register_user", user.id, user.username, user.first_name, user.last_name, datetime.now())
+
+async def get_seen_excluder(user_id: int):
+    if user_id is None:
+        return None
+    await seen_books.ensure_loaded(user_id)
+    return seen_books.excluder(user_id)
+
+async def get_random_books(genre_name: str, limit: int, exclude=None):
+    if not genre_sampler.loaded:
+        return await db.fetch_books("books_by_genre", genre_name, limit)
+    books = await genre_sampler.sample(genre_name, limit, exclude)
+    if len(books) < limit and exclude is not None:
+        # The user has seen (nearly) the whole genre; repeats beat an empty reply.
+        picked = {book.book_id for book in books}
+        books += await genre_sampler.sample(genre_name, limit - len(books), picked.__contains__)
+    return books
+
+async def get_book_recommendations(genre_name: str, limit: int = 3, user_id: int = None):
+    exclude = await get_seen_excluder(user_id)
+    books = await recommender.recommend(user_id, genre_name, limit, exclude) if user_id is not None else []
+    if len(books) < limit:
+        # Cold-start users and thin neighborhoods are topped up at random.
+        picked = {book.book_id for book in books}
+        for book in await get_random_books(genre_name, limit, exclude):
+            if len(books) == limit:
+                break
+            if book.book_id not in picked:
+                books.append(book)
+    return books
+
+async def get_random_book(user_id: int = None):
+    if genre_sampler.loaded:
+        exclude = await get_seen_excluder(user_id)
+        return await genre_sampler.sample_any(exclude) or await genre_sampler.sample_any()
+    return await db.fetchrow_book("random_book")
 
 async def save_recommendation(user_id: int, book_id: int):
-    conn = await asyncpg.connect(**DB_CONFIG)
-    try:
-        await conn.execute("""
-            INSERT INTO Recommendations (user_id, book_id, recommended_at)
-            VALUES ($1, $2, $3)
-        """, user_id, book_id, datetime.now())
-    finally:
-        await conn.close()
+    seen_books.add(user_id, book_id)
+    await recommendation_writer.put(user_id, book_id)
 
 async def add_to_reading_list(user_id: int, book_id: int):
-    conn = await asyncpg.connect(**DB_CONFIG)
-    try:
-        await conn.execute("""
-            INSERT INTO ReadingList (user_id, book_id, added_at)
-            VALUES ($1, $2, $3)
-            ON CONFLICT DO NOTHING
-        """, user_id, book_id, datetime.now())
-    finally:
-        await conn.close()
+    await db.execute("add_to_reading_list", user_id, book_id, datetime.now())
+    seen_books.add(user_id, book_id)
+
+async def fetch_page(query: str, user_id: int, cursor: int = 0, backward: bool = False):
+    if backward:
+        rows = await db.fetch_books(f"{query}_before", user_id, cursor, PAGE_SIZE + 1)
+        books = rows[:PAGE_SIZE][::-1]
+        return books, len(rows) > PAGE_SIZE, True
+    rows = await db.fetch_books(f"{query}_after", user_id, cursor, PAGE_SIZE + 1)
+    return rows[:PAGE_SIZE], cursor > 0, len(rows) > PAGE_SIZE
+
+async def get_user_books(user_id: int, cursor: int = 0, backward: bool = False):
+    return await user_cache.get(
+        user_id, ("user_books", cursor, backward), partial(fetch_page, "user_books", user_id, cursor, backward)
+    )
 
-async def get_user_books(user_id: int):
-    conn = await asyncpg.connect(**DB_CONFIG)
-    try:
-        books = await conn.fetch("""
-            SELECT b.book_id, b.title, b.author, b.publication_year, b.rating, g.genre_name
-            FROM Books b
-            JOIN Genres g ON b.genre_id = g.genre_id
-            WHERE b.user_id = $1
-        """, user_id)
-        return books
-    finally:
-        await conn.close()
+async def get_reading_list(user_id: int, cursor: int = 0, backward: bool = False):
+    return await user_cache.get(
+        user_id, ("reading_list", cursor, backward), partial(fetch_page, "reading_list", user_id, cursor, backward)
+    )
 
-async def get_reading_list(user_id: int):
-    conn = await asyncpg.connect(**DB_CONFIG)
-    try:
-        books = await conn.fetch("""
-            SELECT b.book_id, b.title, b.author, b.publication_year, b.rating, g.genre_name
-            FROM ReadingList rl
-            JOIN Books b ON rl.book_id = b.book_id
-            JOIN Genres g ON b.genre_id = g.genre_id
-            WHERE rl.user_id = $1
-        """, user_id)
-        return books
-    finally:
-        await conn.close()
+def my_books_page(books, has_prev: bool, has_next: bool):
+    keyboard = book_actions_keyboard(books, pagination_row(BooksPage, books, has_prev, has_next))
+    return render_page("Your books:", books), keyboard
+
+def reading_list_page(books, has_prev: bool, has_next: bool):
+    keyboard = pagination_keyboard(ReadingListPage, books, has_prev, has_next)
+    return render_page("Your reading list:", books), keyboard
+
+EMPTY_STATS = {"books_added": 0, "recommendations_received": 0, "reading_list_count": 0}
 
 async def get_user_stats(user_id: int):
-    conn = await asyncpg.connect(**DB_CONFIG)
-    try:
-        stats = await conn.fetchrow("""
-            SELECT
-                (SELECT COUNT(*) FROM Books WHERE user_id = $1) as books_added,
-                (SELECT COUNT(*) FROM Recommendations WHERE user_id = $1) as recommendations_received,
-                (SELECT COUNT(*) FROM ReadingList WHERE user_id = $1) as reading_list_count
-        """, user_id)
-        return stats
-    finally:
-        await conn.close()
+    return await user_cache.get(user_id, ("stats",), partial(db.fetchrow, "user_stats", user_id)) or EMPTY_STATS
+
+async def get_genre_id(genre_name: str):
+    return await genre_cache.get_id(genre_name)
+
+async def reply(message: types.Message, text: str, **kwargs):
+    await outbox.send(message.answer(text, **kwargs))
+
+async def back_to_menu(message: types.Message):
+    await outbox.menu(message.chat.id, "Back to main menu:", MAIN_MENU)
+
+def search_page(query: str, books, page: int, has_prev: bool, has_next: bool):
+    keyboard = search_keyboard(books, page_row(partial(SearchPage, query=query), page, has_prev, has_next))
+    return render_page(f"Search results for: {escape_markdown(query)}", books), keyboard
+
+async def answer_search(message: types.Message, text: str):
+    """Reply with the first page of results; False if nothing matched."""
+    query, books = await book_search.search(text)
+    if not books:
+        return False
+    books, has_prev, has_next = await book_search.page(query, 0, SEARCH_PAGE_SIZE)
+    text, keyboard = search_page(query, books, 0, has_prev, has_next)
+    await reply(message, text, parse_mode="Markdown", reply_markup=keyboard)
+    await back_to_menu(message)
+    return True
+
+async def answer_chunks(message: types.Message, chunks, reply_markup=None):
+    for chunk in chunks[:-1]:
+        await reply(message, chunk, parse_mode="Markdown")
+    await reply(message, chunks[-1], parse_mode="Markdown", reply_markup=reply_markup)
 
 @dp.message(Command("start"))
 async def start_command(message: types.Message, state: FSMContext):
     await state.clear()
     await register_user(message.from_user)
-    keyboard = await get_main_menu()
-    await message.answer(
+    await reply(message,
         "Welcome to the Enhanced Book Bot! 📚\n"
         "What would you like to do?",
-        reply_markup=keyboard
+        reply_markup=MAIN_MENU
     )
 
-@dp.message(lambda message: message.text == "📚 Get Recommendations")
+@dp.message(Command("search"))
+async def search_command(message: types.Message, state: FSMContext, command: CommandObject):
+    await state.clear()
+    if not command.args:
+        await reply(message, "Send /search followed by a title or author, e.g. /search dune herbert")
+        return
+    if not await answer_search(message, command.args):
+        await reply(message, "No books matched your search.", reply_markup=MAIN_MENU)
+
+@dp.inline_query()
+async def inline_search(inline_query: types.InlineQuery):
+    offset = int(inline_query.offset or 0)
+    _, books = await book_search.search(inline_query.query)
+    page = books[offset:offset + INLINE_PAGE_SIZE]
+    results = [
+        types.InlineQueryResultArticle(
+            id=str(book.book_id),
+            title=book.title,
+            description=f"{book.author} ({book.publication_year})",
+            input_message_content=types.InputTextMessageContent(message_text=format_book(book), parse_mode="Markdown"),
+        )
+        for book in page
+    ]
+    next_offset = str(offset + INLINE_PAGE_SIZE) if len(books) > offset + INLINE_PAGE_SIZE else ""
+    await inline_query.answer(results, cache_time=60, next_offset=next_offset)
+
+@menu_routes.route(MENU_RECOMMENDATIONS)
 async def get_recommendations(message: types.Message, state: FSMContext):
     await state.clear()
     keyboard = await get_genre_keyboard()
-    await message.answer(
+    await reply(message,
         "Choose a genre for book recommendations:",
         reply_markup=keyboard
     )
 
-@dp.message(lambda message: message.text == "➕ Add Book")
+@menu_routes.route(MENU_ADD_BOOK)
 async def add_book_start(message: types.Message, state: FSMContext):
     await state.clear()
-    await message.answer("Enter the book title:", reply_markup=types.ReplyKeyboardRemove())
+    await reply(message, "Enter the book title:", reply_markup=types.ReplyKeyboardRemove())
     await state.set_state(AddBookForm.title)
 
-@dp.message(lambda message: message.text == "📖 My Books")
+@menu_routes.route(MENU_MY_BOOKS)
 async def my_books(message: types.Message, state: FSMContext):
     await state.clear()
-    books = await get_user_books(message.from_user.id)
+    books, has_prev, has_next = await get_user_books(message.from_user.id)
     if not books:
-        await message.answer("You haven't added any books yet. Use 'Add Book' to start!", reply_markup=await get_main_menu())
+        await reply(message, "You haven't added any books yet. Use 'Add Book' to start!", reply_markup=MAIN_MENU)
         return
 
-    response = "Your books:\n\n"
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-    for book in books:
-        rating = book['rating'] if book['rating'] is not None else "Unrated"
-        response += f"📖 *{book['title']}* by {book['author']} ({book['publication_year']}, {book['genre_name']}, Rating: {rating}/5)\n"
-        keyboard.inline_keyboard.append([
-            InlineKeyboardButton(text=f"Update {book['title']}", callback_data=f"update_{book['book_id']}"),
-            InlineKeyboardButton(text=f"Delete {book['title']}", callback_data=f"delete_{book['book_id']}")
-        ])
-    
-    await message.answer(response, parse_mode="Markdown", reply_markup=keyboard)
-    await message.answer("Back to main menu:", reply_markup=await get_main_menu())
-
-@dp.message(lambda message: message.text == "⭐ Surprise Me!")
+    text, keyboard = my_books_page(books, has_prev, has_next)
+    await reply(message, text, parse_mode="Markdown", reply_markup=keyboard)
+    await back_to_menu(message)
+
+@menu_routes.route(MENU_SURPRISE)
 async def surprise_me(message: types.Message, state: FSMContext):
     await state.clear()
-    book = await get_random_book()
+    book = await get_random_book(message.from_user.id)
     if not book:
-        await message.answer("No books available. Add some books first!", reply_markup=await get_main_menu())
+        await reply(message, "No books available. Add some books first!", reply_markup=MAIN_MENU)
         return
 
-    rating = book['rating'] if book['rating'] is not None else "Unrated"
-    response = f"Surprise Book! 🎉\n\n📖 *{book['title']}* by {book['author']} ({book['publication_year']}, {book['genre_name']}, Rating: {rating}/5)"
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Add to Reading List", callback_data=f"add_reading_{book['book_id']}")]
-    ])
-    await save_recommendation(message.from_user.id, book['book_id'])
-    await message.answer(response, parse_mode="Markdown", reply_markup=keyboard)
-    await message.answer("Back to main menu:", reply_markup=await get_main_menu())
+    response = f"Surprise Book! 🎉\n\n{format_book(book)}"
+    await save_recommendation(message.from_user.id, book.book_id)
+    await reply(message, response, parse_mode="Markdown", reply_markup=surprise_keyboard(book))
+    await back_to_menu(message)
 
-@dp.message(lambda message: message.text == "📋 My Reading List")
+@menu_routes.route(MENU_READING_LIST)
 async def my_reading_list(message: types.Message, state: FSMContext):
     await state.clear()
-    books = await get_reading_list(message.from_user.id)
+    books, has_prev, has_next = await get_reading_list(message.from_user.id)
     if not books:
-        await message.answer("Your reading list is empty. Add books from recommendations!", reply_markup=await get_main_menu())
+        await reply(message, "Your reading list is empty. Add books from recommendations!", reply_markup=MAIN_MENU)
         return
 
-    response = "Your reading list:\n\n"
-    for book in books:
-        rating = book['rating'] if book['rating'] is not None else "Unrated"
-        response += f"📖 *{book['title']}* by {book['author']} ({book['publication_year']}, {book['genre_name']}, Rating: {rating}/5)\n"
-    
-    await message.answer(response, parse_mode="Markdown")
-    await message.answer("Back to main menu:", reply_markup=await get_main_menu())
+    text, keyboard = reading_list_page(books, has_prev, has_next)
+    await reply(message, text, parse_mode="Markdown", reply_markup=keyboard)
+    await back_to_menu(message)
 
-@dp.message(lambda message: message.text == "📊 My Stats")
+@menu_routes.route(MENU_STATS)
 async def my_stats(message: types.Message, state: FSMContext):
     await state.clear()
     stats = await get_user_stats(message.from_user.id)
-    response = "Your stats:\n\n"
-    response += f"📚 Books added: {stats['books_added']}\n"
-    response += f"✅ Recommendations received: {stats['recommendations_received']}\n"
-    response += f"📋 Reading list items: {stats['reading_list_count']}\n"
-    await message.answer(response, reply_markup=await get_main_menu())
-
-@dp.message()
-async def handle_genre_selection(message: types.Message, state: FSMContext):
-    genre = message.text
-    conn = await asyncpg.connect(**DB_CONFIG)
-    try:
-        genre_exists = await conn.fetchval(
-            "SELECT EXISTS(SELECT 1 FROM Genres WHERE genre_name = $1)", genre
-        )
-        if not genre_exists:
-            await message.answer(
-                "Please select a valid genre from the keyboard below:",
-                reply_markup=await get_genre_keyboard()
-            )
-            return
+    await reply(message, render_stats(stats), reply_markup=MAIN_MENU)
 
-        books = await get_book_recommendations(genre)
-        if not books:
-            await message.answer(
-                f"No books found for genre: {genre}. Try another genre:",
-                reply_markup=await get_genre_keyboard()
-            )
-            return
-
-        response = f"Here are 3 {genre} book recommendations:\n\n"
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-        for book in books:
-            rating = book['rating'] if book['rating'] is not None else "Unrated"
-            response += f"📖 *{book['title']}* by {book['author']} ({book['publication_year']}, Rating: {rating}/5)\n"
-            keyboard.inline_keyboard.append([
-                InlineKeyboardButton(text=f"Add {book['title']} to Reading List", callback_data=f"add_reading_{book['book_id']}")
-            ])
-            await save_recommendation(message.from_user.id, book['book_id'])
-        
-        await message.answer(response, parse_mode="Markdown", reply_markup=keyboard)
-        await message.answer("Back to main menu:", reply_markup=await get_main_menu())
-    except Exception as e:
-        logger.error(f"Error in handle_genre_selection: {e}")
-        await message.answer("An error occurred. Please try again.", reply_markup=await get_main_menu())
-    finally:
-        await conn.close()
-
-@dp.message(AddBookForm.title)
+@state_routes.route(AddBookForm.title)
 async def process_title(message: types.Message, state: FSMContext):
     await state.update_data(title=message.text)
-    await message.answer("Enter the author:")
+    await reply(message, "Enter the author:")
     await state.set_state(AddBookForm.author)
 
-@dp.message(AddBookForm.author)
+@state_routes.route(AddBookForm.author)
 async def process_author(message: types.Message, state: FSMContext):
     await state.update_data(author=message.text)
-    await message.answer("Enter the genre (e.g., Fiction, History, Self-Help):")
+    await reply(message, "Enter the genre (e.g., Fiction, History, Self-Help):")
     await state.set_state(AddBookForm.genre)
 
-@dp.message(AddBookForm.genre)
+@state_routes.route(AddBookForm.genre)
 async def process_genre(message: types.Message, state: FSMContext):
     genre = message.text
-    conn = await asyncpg.connect(**DB_CONFIG)
-    try:
-        genre_id = await conn.fetchval(
-            "SELECT genre_id FROM Genres WHERE genre_name = $1", genre
-        )
-        if not genre_id:
-            await message.answer("Genre not found. Please choose an existing genre:")
-            return
-        await state.update_data(genre_id=genre_id)
-        await message.answer("Enter the publication year (e.g., 2020):")
-        await state.set_state(AddBookForm.year)
-    finally:
-        await conn.close()
+    genre_id = await get_genre_id(genre)
+    if not genre_id:
+        await reply(message, "Genre not found. Please choose an existing genre:")
+        return
+    await state.update_data(genre_id=genre_id)
+    await reply(message, "Enter the publication year (e.g., 2020):")
+    await state.set_state(AddBookForm.year)
 
-@dp.message(AddBookForm.year)
+@state_routes.route(AddBookForm.year)
 async def process_year(message: types.Message, state: FSMContext):
     try:
         year = int(message.text)
         if year < 0 or year > datetime.now().year + 1:
-            await message.answer("Please enter a valid year:")
+            await reply(message, "Please enter a valid year:")
             return
         await state.update_data(year=year)
-        await message.answer("Enter your rating (1-5):")
+        await reply(message, "Enter your rating (1-5):")
         await state.set_state(AddBookForm.rating)
     except ValueError:
-        await message.answer("Please enter a valid number for the year:")
+        await reply(message, "Please enter a valid number for the year:")
 
-@dp.message(AddBookForm.rating)
+@state_routes.route(AddBookForm.rating)
 async def process_rating(message: types.Message, state: FSMContext):
     try:
         rating = int(message.text)
         if rating < 1 or rating > 5:
-            await message.answer("Please enter a rating between 1 and 5:")
+            await reply(message, "Please enter a rating between 1 and 5:")
             return
         data = await state.get_data()
-        conn = await asyncpg.connect(**DB_CONFIG)
-        try:
-            await conn.execute("""
-                INSERT INTO Books (title, author, genre_id, publication_year, user_id, rating)
-                VALUES ($1, $2, $3, $4, $5, $6)
-            """, data['title'], data['author'], data['genre_id'], data['year'], message.from_user.id, rating)
-            await message.answer("Book added successfully!", reply_markup=await get_main_menu())
-            await state.clear()
-        finally:
-            await conn.close()
+        await db.execute("add_book", data['title'], data['author'], data['genre_id'], data['year'], message.from_user.id, rating)
+        await user_cache.invalidate(message.from_user.id)
+        genre_sampler.refresh_soon()
+        await reply(message, "Book added successfully!", reply_markup=MAIN_MENU)
+        await state.clear()
     except ValueError:
-        await message.answer("Please enter a valid number for the rating:")
+        await reply(message, "Please enter a valid number for the rating:")
 
-@dp.callback_query(lambda c: c.data.startswith("add_reading_"))
-async def add_reading_list_callback(callback: types.CallbackQuery):
-    book_id = int(callback.data.split("_")[2])
-    await add_to_reading_list(callback.from_user.id, book_id)
-    await callback.message.answer("Book added to your reading list!", reply_markup=await get_main_menu())
+@callback_routes.route(AddReading)
+async def add_reading_list_callback(callback: types.CallbackQuery, callback_data: AddReading, state: FSMContext):
+    await add_to_reading_list(callback.from_user.id, callback_data.book_id)
+    await user_cache.invalidate(callback.from_user.id)
+    await reply(callback.message, "Book added to your reading list!", reply_markup=MAIN_MENU)
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data.startswith("delete_"))
-async def delete_book_callback(callback: types.CallbackQuery):
-    book_id = int(callback.data.split("_")[1])
-    conn = await asyncpg.connect(**DB_CONFIG)
-    try:
-        await conn.execute("DELETE FROM Books WHERE book_id = $1 AND user_id = $2", book_id, callback.from_user.id)
-        await callback.message.answer("Book deleted successfully!", reply_markup=await get_main_menu())
-    finally:
-        await conn.close()
+@callback_routes.route(BooksPage)
+async def my_books_page_callback(callback: types.CallbackQuery, callback_data: BooksPage, state: FSMContext):
+    books, has_prev, has_next = await get_user_books(
+        callback.from_user.id, callback_data.cursor, backward=callback_data.backward
+    )
+    if not books:
+        await callback.answer("No more books.")
+        return
+    text, keyboard = my_books_page(books, has_prev, has_next)
+    await outbox.send(callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard))
+    await callback.answer()
+
+@callback_routes.route(ReadingListPage)
+async def reading_list_page_callback(callback: types.CallbackQuery, callback_data: ReadingListPage, state: FSMContext):
+    books, has_prev, has_next = await get_reading_list(
+        callback.from_user.id, callback_data.cursor, backward=callback_data.backward
+    )
+    if not books:
+        await callback.answer("No more books.")
+        return
+    text, keyboard = reading_list_page(books, has_prev, has_next)
+    await outbox.send(callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard))
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data.startswith("update_"))
-async def update_book_start(callback: types.CallbackQuery, state: FSMContext):
-    book_id = int(callback.data.split("_")[1])
-    await state.update_data(book_id=book_id)
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Title", callback_data="field_title")],
-        [InlineKeyboardButton(text="Author", callback_data="field_author")],
-        [InlineKeyboardButton(text="Genre", callback_data="field_genre")],
-        [InlineKeyboardButton(text="Year", callback_data="field_year")],
-        [InlineKeyboardButton(text="Rating", callback_data="field_rating")]
-    ])
-    await callback.message.answer("Which field would you like to update?", reply_markup=keyboard)
+@callback_routes.route(SearchPage)
+async def search_page_callback(callback: types.CallbackQuery, callback_data: SearchPage, state: FSMContext):
+    page = callback_data.page
+    # Normalizing again keeps a hand-crafted payload to what a search could have produced.
+    query = normalize_query(callback_data.query)
+    if not query:
+        await callback.answer("This search has expired, please search again.")
+        return
+    books, has_prev, has_next = await book_search.page(query, page, SEARCH_PAGE_SIZE)
+    if not books:
+        await callback.answer("No more results.")
+        return
+    text, keyboard = search_page(query, books, page, has_prev, has_next)
+    await outbox.send(callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard))
+    await callback.answer()
+
+@callback_routes.route(DeleteBook)
+async def delete_book_callback(callback: types.CallbackQuery, callback_data: DeleteBook, state: FSMContext):
+    await db.execute("delete_book", callback_data.book_id, callback.from_user.id)
+    await user_cache.invalidate(callback.from_user.id)
+    await reply(callback.message, "Book deleted successfully!", reply_markup=MAIN_MENU)
+    await callback.answer()
+
+@callback_routes.route(UpdateBook)
+async def update_book_start(callback: types.CallbackQuery, callback_data: UpdateBook, state: FSMContext):
+    await state.update_data(book_id=callback_data.book_id)
+    await reply(callback.message, "Which field would you like to update?", reply_markup=UPDATE_FIELDS_KEYBOARD)
     await state.set_state(UpdateBookForm.field)
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data.startswith("field_"))
-async def process_update_field(callback: types.CallbackQuery, state: FSMContext):
-    field = callback.data.split("_")[1]
+@callback_routes.route(UpdateField)
+async def process_update_field(callback: types.CallbackQuery, callback_data: UpdateField, state: FSMContext):
+    field = callback_data.field
     await state.update_data(field=field)
-    await callback.message.answer(f"Enter the new value for {field}:", reply_markup=types.ReplyKeyboardRemove())
+    await reply(callback.message, f"Enter the new value for {field}:", reply_markup=types.ReplyKeyboardRemove())
     await state.set_state(UpdateBookForm.value)
     await callback.answer()
 
-@dp.message(UpdateBookForm.value)
+@state_routes.route(UpdateBookForm.value)
 async def process_update_value(message: types.Message, state: FSMContext):
     data = await state.get_data()
     field = data['field']
     book_id = data['book_id']
     value = message.text
-    conn = await asyncpg.connect(**DB_CONFIG)
     try:
         if field == "year":
             value = int(value)
             if value < 0 or value > datetime.now().year + 1:
-                await message.answer("Please enter a valid year:")
+                await reply(message, "Please enter a valid year:")
                 return
+            field = "publication_year"
         elif field == "rating":
             value = int(value)
             if value < 1 or value > 5:
-                await message.answer("Please enter a rating between 1 and 5:")
+                await reply(message, "Please enter a rating between 1 and 5:")
                 return
         elif field == "genre":
-            genre_id = await conn.fetchval("SELECT genre_id FROM Genres WHERE genre_name = $1", value)
+            genre_id = await get_genre_id(value)
             if not genre_id:
-                await message.answer("Genre not found. Please choose an existing genre:")
+                await reply(message, "Genre not found. Please choose an existing genre:")
                 return
             value = genre_id
             field = "genre_id"
 
-        await conn.execute(f"""
-            UPDATE Books
-            SET {field} = $1
-            WHERE book_id = $2 AND user_id = $3
-        """, value, book_id, message.from_user.id)
-        await message.answer("Book updated successfully!", reply_markup=await get_main_menu())
+        await db.execute(f"update_book_{field}", value, book_id, message.from_user.id)
+        await user_cache.invalidate(message.from_user.id)
+        if field == "genre_id":
+            genre_sampler.add(message.text, book_id)
+        await reply(message, "Book updated successfully!", reply_markup=MAIN_MENU)
         await state.clear()
     except ValueError:
-        await message.answer(f"Please enter a valid value for {field}:")
+        await reply(message, f"Please enter a valid value for {field}:")
     except Exception as e:
         logger.error(f"Error in update: {e}")
-        await message.answer("An error occurred. Please try again.")
+        await reply(message, "An error occurred. Please try again.")
+
+async def handle_genre_selection(message: types.Message, state: FSMContext):
+    genre = message.text
+    try:
+        genre_exists = await genre_cache.exists(genre)
+        if not genre_exists:
+            # Free text that is not a genre is treated as a title/author search.
+            if genre and not genre.startswith("/") and await answer_search(message, genre):
+                return
+            await reply(message,
+                "Please select a valid genre from the keyboard below:",
+                reply_markup=await get_genre_keyboard()
+            )
+            return
+
+        books = await get_book_recommendations(genre, user_id=message.from_user.id)
+        if not books:
+            await reply(message,
+                f"No books found for genre: {genre}. Try another genre:",
+                reply_markup=await get_genre_keyboard()
+            )
+            return
+
+        for book in books:
+            await save_recommendation(message.from_user.id, book.book_id)
+        chunks = render_books(f"Here are 3 {genre} book recommendations:", books, with_genre=False)
+        await answer_chunks(message, chunks, reply_markup=reading_list_keyboard(books))
+        await back_to_menu(message)
+    except Exception as e:
+        logger.error(f"Error in handle_genre_selection: {e}")
+        await reply(message, "An error occurred. Please try again.", reply_markup=MAIN_MENU)
+
+# Registration order: commands, then menu buttons (which reset any open
+# form), then form states, then free text as the fallback.
+@dp.message(menu_routes)
+async def dispatch_menu(message: types.Message, state: FSMContext, route):
+    # The user tapped a main-menu button, so that keyboard is on screen.
+    outbox.note_keyboard(message.chat.id, MAIN_MENU)
+    await route(message, state)
+
+@dp.message(state_routes)
+async def dispatch_state(message: types.Message, state: FSMContext, route):
+    await route(message, state)
+
+dp.message.register(handle_genre_selection)
+
+@dp.callback_query(callback_routes)
+async def dispatch_callback(callback: types.CallbackQuery, state: FSMContext, route, callback_data):
+    await route(callback, callback_data, state)
+
+@dp.callback_query()
+async def expired_callback(callback: types.CallbackQuery):
+    # Buttons from older message layouts (see callbacks.py).
+    await callback.answer("This button has expired. Please open the menu again.")
+
+background_tasks = []
+metrics_runner = None
+
+async def timed_phase(timings: dict, name: str, awaitable):
+    start = time.perf_counter()
+    try:
+        return await awaitable
     finally:
-        await conn.close()
+        timings[name] = time.perf_counter() - start
+
+async def startup(init_schema: bool = True, metrics_port: int = metrics.METRICS_PORT):
+    global metrics_runner
+    start = time.perf_counter()
+    timings = {}
+    # Pooled connections hold no schema-dependent state until first use, so the
+    # pool opens alongside the metrics server and the schema check.
+    phases = [
+        timed_phase(timings, "metrics", metrics.start_server(port=metrics_port)),
+        timed_phase(timings, "db_pool", db.create_pool()),
+    ]
+    if init_schema:
+        phases.append(timed_phase(timings, "schema", init_db()))
+    metrics_runner, *_ = await asyncio.gather(*phases)
+    # Warm-up queries are independent, so they share the pool instead of queueing.
+    await asyncio.gather(
+        timed_phase(timings, "genre_cache", genre_cache.reload()),
+        timed_phase(timings, "search", book_search.detect()),
+        timed_phase(timings, "genre_sampler", genre_sampler.refresh(full=True)),
+    )
+    background_tasks.append(asyncio.create_task(genre_sampler.run()))
+    background_tasks.append(asyncio.create_task(user_cache.run()))
+    recommendation_writer.start()
+    outbox.start()
+    if RECONCILE_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(run_reconciler()))
+    if isinstance(fsm_storage, PostgresStorage):
+        background_tasks.append(asyncio.create_task(fsm_storage.run_sweeper()))
+    phases = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items())
+    logger.info(f"Startup finished in {(time.perf_counter() - start) * 1000:.0f} ms ({phases})")
+
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    await genre_sampler.close()
+    await recommendation_writer.close()
+    await db.close_pool()
+    await outbox.close()
+    if _bot is not None:
+        await _bot.session.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
 
 async def main():
-    await init_db()
-    
+    await startup()
     try:
-        await dp.start_polling(bot)
+        # Keep handle_as_tasks on: PostgresStorage caches FSM state per task, so
+        # handling updates inline would serve one update's state to the next.
+        await dp.start_polling(get_bot(), handle_as_tasks=True)
     finally:
-        await bot.session.close()
+        await shutdown()
+
+async def run_webhook(init_schema: bool = True, metrics_port: int = metrics.METRICS_PORT):
+    async def on_startup():
+        await startup(init_schema, metrics_port)
+        if init_schema:
+            await webhook.register_webhook(get_bot())
+
+    await webhook.serve(dp, get_bot(), on_startup, shutdown)
+
+def run_webhook_worker(index: int, workers: int):
+    # A chat's updates can land on any worker, so only trust the per-process
+    # record of its keyboard within the handling of a single update.
+    outbox.keyboard_ttl = min(outbox.keyboard_ttl, 2)
+    # Likewise for seen books: pick up other workers' recommendations before each use.
+    seen_books.refresh_interval = SEEN_WORKER_REFRESH
+    # Telegram's global limit is per bot; every worker gets an equal share.
+    outbox.set_global_rate(outbox.global_rate / workers)
+    # Metrics are per process, so each worker gets its own port.
+    metrics_port = metrics.METRICS_PORT + index if metrics.METRICS_PORT else 0
+    asyncio.run(run_webhook(init_schema=False, metrics_port=metrics_port))
+
+async def prepare_webhook_workers():
+    await init_db()
+    bot = get_bot()
+    await webhook.register_webhook(bot)
+    await bot.session.close()
+
+def main_webhook(workers: int):
+    webhook.check_secret()
+    if workers <= 1:
+        asyncio.run(run_webhook())
+        return
+    # Schema and webhook registration happen once; each worker binds the
+    # same port with SO_REUSEPORT and runs its own event loop and pool.
+    asyncio.run(prepare_webhook_workers())
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_webhook_worker, args=(i, workers), name=f"webhook-{i}") for i in range(workers)
+    ]
+
+    def forward(signum, frame):
+        # Each worker drains its in-flight updates and closes its pool on the signal.
+        for process in processes:
+            if process.pid is not None and process.is_alive():
+                os.kill(process.pid, signum)
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, forward)
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        if process.exitcode:
+            logger.error(f"Webhook worker {process.name} exited with code {process.exitcode}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Book recommendation Telegram bot")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default=os.getenv("BOT_MODE", "polling"))
+    parser.add_argument("--workers", type=int, default=webhook.WEBHOOK_WORKERS)
+    args = parser.parse_args()
+    if args.mode == "webhook":
+        main_webhook(args.workers)
+    else:
+        asyncio.run(main())
@@ -0,0 +1,33 @@
+"""Compact book rows.
+
+Book queries return db.BOOK_COLUMNS, optionally followed by genre_name, in
+that order. db.fetch_books() decodes each asyncpg.Record into a Book once,
+positionally; after that handlers, the renderers and the in-process caches
+(search results, per-user pages) read plain attributes instead of looking
+fields up by name on the Record.
+"""
+from itertools import starmap
+
+
+class Book:
+    __slots__ = ("book_id", "title", "author", "publication_year", "rating", "genre_name")
+
+    def __init__(self, book_id: int, title: str, author: str, publication_year: int, rating: int,
+                 genre_name: str = None):
+        self.book_id = book_id
+        self.title = title
+        self.author = author
+        self.publication_year = publication_year
+        self.rating = rating
+        self.genre_name = genre_name
+
+    def __repr__(self):
+        return f"Book(book_id={self.book_id}, title={self.title!r}, author={self.author!r})"
+
+
+def decode_book(record):
+    return None if record is None else Book(*record)
+
+
+def decode_books(records):
+    return list(starmap(Book, records))
@@ -0,0 +1,39 @@
+"""Inline-button payloads.
+
+Each prefix carries a version digit; bump it whenever a payload's fields
+change so buttons on old messages fall through to the "expired" reply
+instead of being parsed with the wrong layout.
+"""
+from aiogram.filters.callback_data import CallbackData
+
+
+class AddReading(CallbackData, prefix="ar1"):
+    book_id: int
+
+
+class DeleteBook(CallbackData, prefix="db1"):
+    book_id: int
+
+
+class UpdateBook(CallbackData, prefix="ub1"):
+    book_id: int
+
+
+class UpdateField(CallbackData, prefix="uf1"):
+    field: str
+
+
+class BooksPage(CallbackData, prefix="bp1"):
+    backward: bool
+    cursor: int
+
+
+class ReadingListPage(CallbackData, prefix="rp1"):
+    backward: bool
+    cursor: int
+
+
+class SearchPage(CallbackData, prefix="sp2"):
+    page: int
+    # A normalized query, at most search.SEARCH_QUERY_MAX_BYTES long.
+    query: str
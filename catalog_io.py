@@ -0,0 +1,226 @@
+"""Bulk catalog import/export through COPY.
+
+Rows are streamed in bounded chunks, so memory stays flat however large the
+file is:
+
+    python catalog_io.py import books.csv
+    python catalog_io.py import books.jsonl --chunk-size 50000
+    python catalog_io.py export catalog.csv
+    python catalog_io.py export catalog.jsonl --all
+
+Both formats use the fields title, author, genre, publication_year, rating.
+Genres are resolved in bulk and created when missing. Catalog books are
+unique on (title, author) (migration 5); rows that are already there, or
+repeated inside the file, are counted as duplicates and skipped.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from itertools import islice
+
+import asyncpg
+
+import db
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = int(os.getenv("CATALOG_IMPORT_CHUNK_SIZE", "10000"))
+EXPORT_FETCH_SIZE = int(os.getenv("CATALOG_EXPORT_FETCH_SIZE", "10000"))
+
+FIELDS = ("title", "author", "genre", "publication_year", "rating")
+STAGING_COLUMNS = ("title", "author", "genre_id", "publication_year", "rating")
+
+CREATE_STAGING_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS catalog_staging (
+        title TEXT NOT NULL,
+        author TEXT NOT NULL,
+        genre_id INTEGER,
+        publication_year INTEGER,
+        rating INTEGER
+    ) ON COMMIT DELETE ROWS
+"""
+
+MERGE_STAGING_SQL = """
+    INSERT INTO Books (title, author, genre_id, publication_year, rating)
+    SELECT DISTINCT ON (title, author) title, author, genre_id, publication_year, rating
+    FROM catalog_staging
+    ORDER BY title, author
+    ON CONFLICT (title, author) WHERE user_id IS NULL DO NOTHING
+"""
+
+EXPORT_SQL = """
+    SELECT b.title, b.author, g.genre_name AS genre, b.publication_year, b.rating
+    FROM Books b
+    LEFT JOIN Genres g ON b.genre_id = g.genre_id
+    {where}
+    ORDER BY b.book_id
+"""
+
+
+def _detect_format(path: str, fmt: str = None):
+    if fmt:
+        return fmt
+    return "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def read_rows(stream, fmt: str):
+    """Yield raw row dicts from a CSV (with header) or JSONL stream."""
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def _optional_int(value):
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def clean_row(row):
+    """(title, author, genre, year, rating) or None if the row is unusable.
+
+    Out-of-range ratings are dropped rather than rejecting the book.
+    """
+    if not isinstance(row, dict):
+        return None
+    title = str(row.get("title") or "").strip()
+    author = str(row.get("author") or "").strip()
+    if not title or not author:
+        return None
+    genre = str(row.get("genre") or "").strip() or None
+    try:
+        year = _optional_int(row.get("publication_year"))
+        rating = _optional_int(row.get("rating"))
+    except (TypeError, ValueError):
+        return None
+    if rating is not None and not 1 <= rating <= 5:
+        rating = None
+    return title, author, genre, year, rating
+
+
+async def resolve_genres(conn, names, genre_ids: dict):
+    """Fill `genre_ids` with ids for `names`, creating missing genres in one round trip each."""
+    missing = sorted({name for name in names if name is not None and name not in genre_ids})
+    if not missing:
+        return
+    await conn.execute(
+        "INSERT INTO Genres (genre_name) SELECT unnest($1::text[]) ON CONFLICT (genre_name) DO NOTHING", missing
+    )
+    for row in await conn.fetch(
+        "SELECT genre_id, genre_name FROM Genres WHERE genre_name = ANY($1::text[])", missing
+    ):
+        genre_ids[row['genre_name']] = row['genre_id']
+
+
+async def import_catalog(conn, stream, fmt: str = "csv", chunk_size: int = IMPORT_CHUNK_SIZE):
+    """Stream rows into Books; returns counts of read, inserted, duplicate and invalid rows."""
+    start = time.perf_counter()
+    counts = {"read": 0, "inserted": 0, "duplicate": 0, "invalid": 0}
+    genre_ids = {}
+    await conn.execute(CREATE_STAGING_SQL)
+
+    rows = read_rows(stream, fmt)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        counts["read"] += len(chunk)
+        cleaned = [row for row in map(clean_row, chunk) if row is not None]
+        counts["invalid"] += len(chunk) - len(cleaned)
+        if not cleaned:
+            continue
+
+        await resolve_genres(conn, (row[2] for row in cleaned), genre_ids)
+        records = [(title, author, genre_ids.get(genre), year, rating)
+                   for title, author, genre, year, rating in cleaned]
+        async with conn.transaction():
+            await conn.copy_records_to_table("catalog_staging", records=records, columns=STAGING_COLUMNS)
+            status = await conn.execute(MERGE_STAGING_SQL)
+        inserted = int(status.split()[-1])
+        counts["inserted"] += inserted
+        counts["duplicate"] += len(records) - inserted
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Imported {counts['inserted']} of {counts['read']} rows ({counts['duplicate']} duplicate, "
+        f"{counts['invalid']} invalid) in {elapsed:.2f}s, {counts['read'] / max(elapsed, 1e-9):,.0f} rows/s"
+    )
+    return counts
+
+
+async def export_catalog(conn, stream, fmt: str = "csv", include_user_books: bool = False,
+                         fetch_size: int = EXPORT_FETCH_SIZE):
+    """Stream the catalog (optionally with user-added books) out; returns the row count."""
+    start = time.perf_counter()
+    query = EXPORT_SQL.format(where="" if include_user_books else "WHERE b.user_id IS NULL")
+    if fmt == "csv":
+        status = await conn.copy_from_query(
+            query, output=lambda data: _write(stream, data.decode()), format="csv", header=True
+        )
+        exported = int(status.split()[-1])
+    else:
+        exported = 0
+        async with conn.transaction():
+            async for row in conn.cursor(query, prefetch=fetch_size):
+                stream.write(json.dumps(dict(row), ensure_ascii=False) + "\n")
+                exported += 1
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Exported {exported} rows in {elapsed:.2f}s, {exported / max(elapsed, 1e-9):,.0f} rows/s")
+    return exported
+
+
+async def _write(stream, text: str):
+    stream.write(text)
+
+
+def _open(path: str, mode: str):
+    if path == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk catalog import/export")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="load books from CSV/JSONL")
+    import_parser.add_argument("path", help="input file, or - for stdin")
+    import_parser.add_argument("--format", choices=("csv", "jsonl"))
+    import_parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+
+    export_parser = commands.add_parser("export", help="dump the catalog to CSV/JSONL")
+    export_parser.add_argument("path", help="output file, or - for stdout")
+    export_parser.add_argument("--format", choices=("csv", "jsonl"))
+    export_parser.add_argument("--all", action="store_true", help="include books added by users")
+
+    args = parser.parse_args(argv)
+    fmt = _detect_format(args.path, args.format)
+    conn = await asyncpg.connect(**db.DB_CONFIG)
+    try:
+        if args.command == "import":
+            with _open(args.path, "r") as stream:
+                await import_catalog(conn, stream, fmt, args.chunk_size)
+        else:
+            with _open(args.path, "w") as stream:
+                await export_catalog(conn, stream, fmt, args.all)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,298 @@
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+from dotenv import load_dotenv
+
+import metrics
+from books import decode_book, decode_books
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "database": os.getenv("DB_NAME", "book_bot"),
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASSWORD", "your_password"),
+    "port": os.getenv("DB_PORT", "5432")
+}
+
+POOL_CONFIG = {
+    "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+    "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+    "max_inactive_connection_lifetime": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+    "command_timeout": float(os.getenv("DB_COMMAND_TIMEOUT", "10")),
+}
+ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "5"))
+
+# Column order is books.Book's constructor order; genre_name, when selected, goes last.
+BOOK_COLUMNS = "b.book_id, b.title, b.author, b.publication_year, b.rating"
+
+# Hot queries, looked up by name. asyncpg prepares each one on a connection's
+# first use and keeps it in that connection's statement cache.
+QUERIES = {
+    "register_user": """
+        INSERT INTO Users (user_id, username, first_name, last_name, created_at)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (user_id) DO NOTHING
+    """,
+    "genres": "SELECT genre_id, genre_name FROM Genres ORDER BY genre_id",
+    "books_by_genre": f"""
+        SELECT {BOOK_COLUMNS}
+        FROM Books b
+        JOIN Genres g ON b.genre_id = g.genre_id
+        WHERE g.genre_name = $1
+        ORDER BY RANDOM()
+        LIMIT $2
+    """,
+    "random_book": f"""
+        SELECT {BOOK_COLUMNS}, g.genre_name
+        FROM Books b
+        JOIN Genres g ON b.genre_id = g.genre_id
+        ORDER BY RANDOM()
+        LIMIT 1
+    """,
+    "book_ids_since": """
+        SELECT b.book_id, g.genre_name
+        FROM Books b
+        JOIN Genres g ON b.genre_id = g.genre_id
+        WHERE b.book_id > $1
+        ORDER BY b.book_id
+    """,
+    # Aggregated server-side: one row per genre instead of one Record per book.
+    "genre_book_ids_since": """
+        SELECT g.genre_name, b.book_ids, b.max_book_id
+        FROM (
+            SELECT genre_id, array_agg(book_id) AS book_ids, MAX(book_id) AS max_book_id
+            FROM Books
+            WHERE book_id > $1
+            GROUP BY genre_id
+        ) b
+        JOIN Genres g ON b.genre_id = g.genre_id
+    """,
+    "books_by_ids": f"""
+        SELECT {BOOK_COLUMNS}, g.genre_name
+        FROM Books b
+        JOIN Genres g ON b.genre_id = g.genre_id
+        WHERE b.book_id = ANY($1::int[])
+    """,
+    # Scores the published neighbors (recommender.py) of the user's latest
+    # ratings and reading-list adds; $3 caps each history source.
+    "neighbor_recommendations": f"""
+        WITH history AS (
+            (SELECT book_id, rating / 5.0 AS weight FROM Books
+             WHERE user_id = $1 AND rating IS NOT NULL
+             ORDER BY book_id DESC LIMIT $3)
+            UNION ALL
+            (SELECT book_id, $5::float8 FROM ReadingList
+             WHERE user_id = $1
+             ORDER BY added_at DESC LIMIT $3)
+        ),
+        scores AS (
+            SELECT n.book_id, SUM(h.weight * n.score) AS score
+            FROM history h
+            JOIN book_neighbors bn ON bn.book_id = h.book_id
+            CROSS JOIN unnest(bn.neighbor_ids, bn.scores) AS n (book_id, score)
+            GROUP BY n.book_id
+        )
+        SELECT {BOOK_COLUMNS}, g.genre_name
+        FROM scores s
+        JOIN Books b ON b.book_id = s.book_id
+        JOIN Genres g ON b.genre_id = g.genre_id
+        WHERE g.genre_name = $2 AND s.book_id NOT IN (SELECT book_id FROM history)
+        ORDER BY s.score DESC, b.book_id
+        LIMIT $4
+    """,
+    "recently_seen_books": """
+        SELECT book_id FROM Recommendations WHERE user_id = $1 AND recommended_at > $2
+        UNION
+        SELECT book_id FROM ReadingList WHERE user_id = $1
+    """,
+    "seen_books_since": """
+        SELECT book_id FROM Recommendations WHERE user_id = $1 AND recommended_at > $2
+        UNION
+        SELECT book_id FROM ReadingList WHERE user_id = $1 AND added_at > $2
+    """,
+    "save_recommendation": """
+        INSERT INTO Recommendations (user_id, book_id, recommended_at)
+        VALUES ($1, $2, $3)
+    """,
+    "add_to_reading_list": """
+        INSERT INTO ReadingList (user_id, book_id, added_at)
+        VALUES ($1, $2, $3)
+        ON CONFLICT DO NOTHING
+    """,
+    "user_books_after": f"""
+        SELECT {BOOK_COLUMNS}, g.genre_name
+        FROM Books b
+        JOIN Genres g ON b.genre_id = g.genre_id
+        WHERE b.user_id = $1 AND b.book_id > $2
+        ORDER BY b.book_id
+        LIMIT $3
+    """,
+    "user_books_before": f"""
+        SELECT {BOOK_COLUMNS}, g.genre_name
+        FROM Books b
+        JOIN Genres g ON b.genre_id = g.genre_id
+        WHERE b.user_id = $1 AND b.book_id < $2
+        ORDER BY b.book_id DESC
+        LIMIT $3
+    """,
+    "reading_list_after": f"""
+        SELECT {BOOK_COLUMNS}, g.genre_name
+        FROM ReadingList rl
+        JOIN Books b ON rl.book_id = b.book_id
+        JOIN Genres g ON b.genre_id = g.genre_id
+        WHERE rl.user_id = $1 AND rl.book_id > $2
+        ORDER BY rl.book_id
+        LIMIT $3
+    """,
+    "reading_list_before": f"""
+        SELECT {BOOK_COLUMNS}, g.genre_name
+        FROM ReadingList rl
+        JOIN Books b ON rl.book_id = b.book_id
+        JOIN Genres g ON b.genre_id = g.genre_id
+        WHERE rl.user_id = $1 AND rl.book_id < $2
+        ORDER BY rl.book_id DESC
+        LIMIT $3
+    """,
+    # $1 is a prefix tsquery built by search.prefix_tsquery().
+    "search_books": f"""
+        SELECT {BOOK_COLUMNS}, g.genre_name
+        FROM to_tsquery('simple', $1) q
+        JOIN Books b ON b.search_vector @@ q
+        LEFT JOIN Genres g ON b.genre_id = g.genre_id
+        ORDER BY ts_rank(b.search_vector, q) DESC, b.book_id
+        LIMIT $2
+    """,
+    "user_stats": """
+        SELECT books_added, recommendations_received, reading_list_count
+        FROM user_stats
+        WHERE user_id = $1
+    """,
+    "add_book": """
+        INSERT INTO Books (title, author, genre_id, publication_year, user_id, rating)
+        VALUES ($1, $2, $3, $4, $5, $6)
+    """,
+    "delete_book": "DELETE FROM Books WHERE book_id = $1 AND user_id = $2",
+    "notify": "SELECT pg_notify($1, $2)",
+    "fsm_get": """
+        SELECT state, data::text AS data
+        FROM fsm_state
+        WHERE key = $1 AND updated_at > now() - $2::interval
+    """,
+    # An expired row is treated as empty, so its old data must not resurface.
+    "fsm_set_state": """
+        INSERT INTO fsm_state AS f (key, state) VALUES ($1, $2)
+        ON CONFLICT (key) DO UPDATE SET
+            state = EXCLUDED.state,
+            data = CASE WHEN f.updated_at > now() - $3::interval THEN f.data ELSE '{}' END,
+            updated_at = now()
+    """,
+    "fsm_set_data": """
+        INSERT INTO fsm_state AS f (key, data) VALUES ($1, $2::jsonb)
+        ON CONFLICT (key) DO UPDATE SET
+            data = EXCLUDED.data,
+            state = CASE WHEN f.updated_at > now() - $3::interval THEN f.state END,
+            updated_at = now()
+    """,
+    "fsm_expire": """
+        DELETE FROM fsm_state
+        WHERE updated_at < now() - $1::interval OR (state IS NULL AND data = '{}')
+    """,
+}
+
+# UPDATE statements cannot parametrize the column, so prepare one per editable field.
+UPDATABLE_COLUMNS = ("title", "author", "genre_id", "publication_year", "rating")
+for _column in UPDATABLE_COLUMNS:
+    QUERIES[f"update_book_{_column}"] = f"""
+        UPDATE Books
+        SET {_column} = $1
+        WHERE book_id = $2 AND user_id = $3
+    """
+
+
+_pool = None
+
+
+async def create_pool(**overrides):
+    global _pool
+    if _pool is not None:
+        return _pool
+    config = {**POOL_CONFIG, **overrides}
+    # Room for every named query, so hot statements are never evicted and re-prepared.
+    config.setdefault("statement_cache_size", max(100, 2 * len(QUERIES)))
+    _pool = await asyncpg.create_pool(**DB_CONFIG, **config)
+    logger.info(f"Database pool created (min={config['min_size']}, max={config['max_size']})")
+    return _pool
+
+
+def set_pool(pool):
+    """Install an already built pool, e.g. a stand-in exposing acquire()/close()."""
+    global _pool
+    _pool = pool
+
+
+def get_pool():
+    if _pool is None:
+        raise RuntimeError("Database pool is not initialized; call create_pool() first")
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+
+def pool_metrics():
+    if _pool is None:
+        return {}
+    return {"size": _pool.get_size(), "idle": _pool.get_idle_size(), "max_size": _pool.get_max_size()}
+
+
+@asynccontextmanager
+async def acquire():
+    start = time.perf_counter()
+    async with get_pool().acquire(timeout=ACQUIRE_TIMEOUT) as conn:
+        metrics.POOL_WAIT.observe(time.perf_counter() - start)
+        yield conn
+
+
+async def _timed(method: str, name: str, args):
+    async with acquire() as conn:
+        start = time.perf_counter()
+        try:
+            return await getattr(conn, method)(QUERIES[name], *args)
+        finally:
+            metrics.observe_query(name, time.perf_counter() - start)
+
+
+async def fetch(name, *args):
+    return await _timed("fetch", name, args)
+
+
+async def fetchrow(name, *args):
+    return await _timed("fetchrow", name, args)
+
+
+async def fetchval(name, *args):
+    return await _timed("fetchval", name, args)
+
+
+async def execute(name, *args):
+    return await _timed("execute", name, args)
+
+
+async def fetch_books(name, *args):
+    """fetch() for queries selecting BOOK_COLUMNS (+ genre_name), decoded to Book objects."""
+    return decode_books(await _timed("fetch", name, args))
+
+
+async def fetchrow_book(name, *args):
+    return decode_book(await _timed("fetchrow", name, args))
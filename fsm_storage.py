@@ -0,0 +1,106 @@
+"""Postgres-backed aiogram FSM storage shared by all bot workers.
+
+State lives in an UNLOGGED table (migration 4): cheap to write, survives
+restarts, and is only lost on a Postgres crash, which for half-finished
+chat forms is an acceptable trade. Forms untouched for FSM_STATE_TTL are
+expired.
+
+Repeated lookups during one update are served from a write-through cache
+that lives only as long as the update. aiogram runs every update in its
+own task (polling with handle_as_tasks, and webhook.UpdateHandler), and
+the cache is kept per task, so the next update for the same user starts
+from the table even when the previous one ran on another worker.
+"""
+import asyncio
+import json
+import logging
+import os
+from contextvars import ContextVar
+from datetime import timedelta
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+import db
+
+logger = logging.getLogger(__name__)
+
+FSM_STATE_TTL = timedelta(seconds=float(os.getenv("FSM_STATE_TTL", "86400")))
+FSM_SWEEP_INTERVAL = float(os.getenv("FSM_SWEEP_INTERVAL", "600"))
+
+_EMPTY = (None, {})
+
+# (task, {storage key: (state, data)}) for the update the current task is handling.
+_update_cache = ContextVar("fsm_update_cache", default=None)
+
+
+def _cache():
+    task = asyncio.current_task()
+    entry = _update_cache.get()
+    # Tasks inherit their parent's context; a task started by a handler gets its own cache.
+    if entry is None or entry[0] is not task:
+        entry = (task, {})
+        _update_cache.set(entry)
+    return entry[1]
+
+
+def _storage_key(key: StorageKey):
+    return ":".join((
+        str(key.bot_id), str(key.chat_id), str(key.user_id), str(key.thread_id or ""),
+        key.business_connection_id or "", key.destiny,
+    ))
+
+
+class PostgresStorage(BaseStorage):
+    def __init__(self, state_ttl: timedelta = FSM_STATE_TTL):
+        self.state_ttl = state_ttl
+
+    async def _load(self, key: str):
+        cache = _cache()
+        entry = cache.get(key)
+        if entry is None:
+            row = await db.fetchrow("fsm_get", key, self.state_ttl)
+            entry = cache[key] = _EMPTY if row is None else (row['state'], json.loads(row['data']))
+        return entry
+
+    async def set_state(self, key: StorageKey, state=None):
+        key = _storage_key(key)
+        state = state.state if isinstance(state, State) else state
+        current_state, data = await self._load(key)
+        if state == current_state:
+            return
+        await db.execute("fsm_set_state", key, state, self.state_ttl)
+        _cache()[key] = (state, data)
+
+    async def get_state(self, key: StorageKey):
+        return (await self._load(_storage_key(key)))[0]
+
+    async def set_data(self, key: StorageKey, data):
+        key = _storage_key(key)
+        data = dict(data)
+        state, current_data = await self._load(key)
+        if data == current_data:
+            return
+        await db.execute("fsm_set_data", key, json.dumps(data), self.state_ttl)
+        _cache()[key] = (state, data)
+
+    async def get_data(self, key: StorageKey):
+        return dict((await self._load(_storage_key(key)))[1])
+
+    async def expire(self):
+        """Delete abandoned forms and rows left empty by state.clear()."""
+        status = await db.execute("fsm_expire", self.state_ttl)
+        return int(status.split()[-1])
+
+    async def run_sweeper(self, interval: float = FSM_SWEEP_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                expired = await self.expire()
+                if expired:
+                    logger.info(f"Expired {expired} FSM rows")
+            except Exception as e:
+                logger.error(f"FSM expiry sweep failed: {e}")
+
+    async def close(self):
+        pass
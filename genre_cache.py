@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import os
+import time
+
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+
+import db
+
+logger = logging.getLogger(__name__)
+
+GENRE_CACHE_TTL = float(os.getenv("GENRE_CACHE_TTL", "300"))
+# A lookup miss may mean another process just added the genre; reload at most this often.
+GENRE_MISS_RELOAD_INTERVAL = float(os.getenv("GENRE_MISS_RELOAD_INTERVAL", "5"))
+
+
+class GenreCache:
+    """Process-wide genre name -> id map with a prebuilt reply keyboard.
+
+    Entries expire after `ttl` seconds so genres changed by other processes
+    are picked up; unknown names trigger a rate-limited reload.
+    """
+
+    def __init__(self, ttl: float = GENRE_CACHE_TTL, miss_reload_interval: float = GENRE_MISS_RELOAD_INTERVAL):
+        self.ttl = ttl
+        self.miss_reload_interval = miss_reload_interval
+        self._ids = {}
+        self._keyboard = None
+        self._loaded_at = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def _age(self):
+        if self._loaded_at is None:
+            return float("inf")
+        return time.monotonic() - self._loaded_at
+
+    def _stale(self):
+        return self._age() >= self.ttl
+
+    async def _load(self):
+        rows = await db.fetch("genres")
+        self._ids = {row['genre_name']: row['genre_id'] for row in rows}
+        self._keyboard = ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text=row['genre_name'])] for row in rows],
+            resize_keyboard=True
+        )
+        self._loaded_at = time.monotonic()
+        logger.info(f"Genre cache loaded {len(self._ids)} genres")
+
+    async def reload(self):
+        async with self._lock:
+            await self._load()
+
+    async def _ensure_fresh(self):
+        if self._stale():
+            async with self._lock:
+                if self._stale():
+                    await self._load()
+
+    async def names(self):
+        await self._ensure_fresh()
+        return list(self._ids)
+
+    async def keyboard(self):
+        await self._ensure_fresh()
+        return self._keyboard
+
+    async def get_id(self, genre_name: str):
+        await self._ensure_fresh()
+        genre_id = self._ids.get(genre_name)
+        if genre_id is None and self._age() >= self.miss_reload_interval:
+            async with self._lock:
+                if self._age() >= self.miss_reload_interval:
+                    await self._load()
+            genre_id = self._ids.get(genre_name)
+        return genre_id
+
+    async def exists(self, genre_name: str):
+        return await self.get_id(genre_name) is not None
@@ -0,0 +1,179 @@
+"""Latency histograms for handlers, queries and Bot API calls, served as Prometheus text.
+
+Kept dependency-free: a histogram is a handful of counters per label set,
+cheap enough to observe on every update and every query. Each process
+serves its own numbers on METRICS_HOST:METRICS_PORT/metrics (webhook workers
+use consecutive ports); set METRICS_PORT=0 to turn the endpoint off.
+Queries slower than METRICS_SLOW_QUERY_MS are logged with their name.
+"""
+import logging
+import os
+import time
+from bisect import bisect_left
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+SLOW_QUERY_SECONDS = float(os.getenv("METRICS_SLOW_QUERY_MS", "0")) / 1000
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(self.label_names + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            series_labels = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{series_labels} {total}")
+            lines.append(f"{self.name}_count{series_labels} {count}")
+        return lines
+
+
+class GaugeSet:
+    """Gauges read from a callback returning {name: value} at scrape time."""
+
+    def __init__(self, prefix: str, read):
+        self.prefix = prefix
+        self.read = read
+
+    def collect(self):
+        lines = []
+        for key, value in self.read().items():
+            name = f"{self.prefix}_{key}"
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        return lines
+
+
+_collectors = []
+
+
+def histogram(name: str, documentation: str, label_names=(), buckets=DEFAULT_BUCKETS):
+    metric = Histogram(name, documentation, label_names, buckets)
+    _collectors.append(metric)
+    return metric
+
+
+def register_gauges(prefix: str, read):
+    _collectors.append(GaugeSet(prefix, read))
+
+
+def render():
+    lines = []
+    for collector in _collectors:
+        try:
+            lines += collector.collect()
+        except Exception as e:
+            logger.error(f"Collecting {getattr(collector, 'name', collector.__class__.__name__)} failed: {e}")
+    return "\n".join(lines) + "\n"
+
+
+HANDLER_LATENCY = histogram(
+    "bot_handler_duration_seconds", "Time spent in each update handler", ("handler", "outcome")
+)
+QUERY_LATENCY = histogram("bot_db_query_duration_seconds", "Time spent executing each named query", ("query",))
+POOL_WAIT = histogram("bot_db_pool_wait_seconds", "Time spent waiting for a pooled connection")
+TELEGRAM_LATENCY = histogram(
+    "bot_telegram_request_duration_seconds", "Bot API request round trips by method", ("method",)
+)
+
+
+def observe_query(name: str, seconds: float, slow_after: float = SLOW_QUERY_SECONDS):
+    QUERY_LATENCY.observe(seconds, name)
+    if slow_after and seconds >= slow_after:
+        logger.warning(f"Slow query {name}: {seconds * 1000:.1f} ms")
+
+
+def handler_name(data):
+    """Name of the function serving an update, looking through routing-table dispatchers."""
+    route = data.get("route")
+    return route.__name__ if route is not None else data["handler"].callback.__name__
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Inner middleware: runs only once a handler matched, so the handler name is known."""
+
+    async def __call__(self, handler, event, data):
+        name = handler_name(data)
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await handler(event, data)
+            outcome = "ok"
+            return result
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - start, name, outcome)
+
+
+class RequestTimingMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            TELEGRAM_LATENCY.observe(time.perf_counter() - start, type(method).__name__)
+
+
+def instrument(dp, bot=None):
+    middleware = HandlerTimingMiddleware()
+    for observer in (dp.message, dp.callback_query, dp.inline_query):
+        observer.middleware(middleware)
+    if bot is not None:
+        instrument_bot(bot)
+
+
+def instrument_bot(bot):
+    bot.session.middleware(RequestTimingMiddleware())
+
+
+async def metrics_handler(request: web.Request):
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Serve /metrics; returns the runner to clean up, or None when disabled or the port is taken."""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logger.error(f"Metrics endpoint disabled, cannot bind {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,280 @@
+import logging
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Serializes migrations when several bot processes start at once.
+MIGRATION_LOCK_ID = 7_301_555_001
+
+# (version, description, sql). Append only; never edit an applied migration.
+MIGRATIONS = [
+    (1, "base tables", """
+        CREATE TABLE IF NOT EXISTS Users (
+            user_id BIGINT PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS Genres (
+            genre_id SERIAL PRIMARY KEY,
+            genre_name TEXT UNIQUE NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS Books (
+            book_id SERIAL PRIMARY KEY,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            genre_id INTEGER REFERENCES Genres(genre_id),
+            publication_year INTEGER,
+            user_id BIGINT REFERENCES Users(user_id),
+            rating INTEGER CHECK (rating >= 1 AND rating <= 5),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS Recommendations (
+            recommendation_id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES Users(user_id),
+            book_id INTEGER REFERENCES Books(book_id),
+            recommended_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS ReadingList (
+            reading_list_id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES Users(user_id),
+            book_id INTEGER REFERENCES Books(book_id),
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        -- Databases created before Books.user_id/rating existed.
+        ALTER TABLE Books ADD COLUMN IF NOT EXISTS user_id BIGINT REFERENCES Users(user_id);
+        ALTER TABLE Books ADD COLUMN IF NOT EXISTS rating INTEGER CHECK (rating >= 1 AND rating <= 5);
+    """),
+    (2, "indexes for hot queries", """
+        CREATE INDEX IF NOT EXISTS books_user_id_book_id_idx ON Books (user_id, book_id);
+        CREATE INDEX IF NOT EXISTS books_genre_id_book_id_idx ON Books (genre_id, book_id);
+        CREATE INDEX IF NOT EXISTS recommendations_user_id_idx ON Recommendations (user_id);
+        CREATE INDEX IF NOT EXISTS recommendations_book_id_idx ON Recommendations (book_id);
+
+        DELETE FROM ReadingList a
+        USING ReadingList b
+        WHERE a.user_id = b.user_id
+          AND a.book_id = b.book_id
+          AND a.reading_list_id > b.reading_list_id;
+        CREATE UNIQUE INDEX IF NOT EXISTS readinglist_user_id_book_id_key ON ReadingList (user_id, book_id);
+        CREATE INDEX IF NOT EXISTS readinglist_book_id_idx ON ReadingList (book_id);
+    """),
+    (3, "materialized per-user stats counters", """
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id BIGINT PRIMARY KEY,
+            books_added INTEGER NOT NULL DEFAULT 0,
+            recommendations_received BIGINT NOT NULL DEFAULT 0,
+            reading_list_count INTEGER NOT NULL DEFAULT 0
+        );
+
+        -- Statement-level so COPY and multi-row writes touch each user's row once.
+        -- TG_ARGV: counter column, +1 for inserts / -1 for deletes.
+        CREATE OR REPLACE FUNCTION user_stats_apply() RETURNS trigger AS $$
+        BEGIN
+            EXECUTE format(
+                'INSERT INTO user_stats (user_id, %1$I)
+                 SELECT user_id, %2$s * COUNT(*) FROM changed_rows WHERE user_id IS NOT NULL GROUP BY user_id
+                 ON CONFLICT (user_id) DO UPDATE SET %1$I = user_stats.%1$I + EXCLUDED.%1$I',
+                TG_ARGV[0], TG_ARGV[1]
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER books_stats_insert AFTER INSERT ON Books
+            REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION user_stats_apply('books_added', '1');
+        CREATE TRIGGER books_stats_delete AFTER DELETE ON Books
+            REFERENCING OLD TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION user_stats_apply('books_added', '-1');
+        CREATE TRIGGER recommendations_stats_insert AFTER INSERT ON Recommendations
+            REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION user_stats_apply('recommendations_received', '1');
+        CREATE TRIGGER recommendations_stats_delete AFTER DELETE ON Recommendations
+            REFERENCING OLD TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION user_stats_apply('recommendations_received', '-1');
+        CREATE TRIGGER readinglist_stats_insert AFTER INSERT ON ReadingList
+            REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION user_stats_apply('reading_list_count', '1');
+        CREATE TRIGGER readinglist_stats_delete AFTER DELETE ON ReadingList
+            REFERENCING OLD TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION user_stats_apply('reading_list_count', '-1');
+
+        INSERT INTO user_stats (user_id, books_added, recommendations_received, reading_list_count)
+        SELECT u.user_id, COALESCE(b.n, 0), COALESCE(r.n, 0), COALESCE(rl.n, 0)
+        FROM Users u
+        LEFT JOIN (SELECT user_id, COUNT(*) AS n FROM Books GROUP BY user_id) b ON b.user_id = u.user_id
+        LEFT JOIN (SELECT user_id, COUNT(*) AS n FROM Recommendations GROUP BY user_id) r ON r.user_id = u.user_id
+        LEFT JOIN (SELECT user_id, COUNT(*) AS n FROM ReadingList GROUP BY user_id) rl ON rl.user_id = u.user_id
+        ON CONFLICT (user_id) DO NOTHING;
+    """),
+    (4, "persistent FSM storage", """
+        CREATE UNLOGGED TABLE IF NOT EXISTS fsm_state (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data JSONB NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS fsm_state_updated_at_idx ON fsm_state (updated_at);
+    """),
+    (5, "unique catalog books by title and author", """
+        -- Fold duplicate catalog rows (e.g. the seed re-inserted on every
+        -- restart) into the oldest copy before enforcing uniqueness.
+        CREATE TEMP TABLE duplicate_books ON COMMIT DROP AS
+        SELECT book_id, keep_id
+        FROM (
+            SELECT book_id, MIN(book_id) OVER (PARTITION BY title, author) AS keep_id
+            FROM Books
+            WHERE user_id IS NULL
+        ) ranked
+        WHERE book_id <> keep_id;
+
+        UPDATE Recommendations r SET book_id = d.keep_id
+        FROM duplicate_books d WHERE r.book_id = d.book_id;
+
+        -- Keep one reading-list row per (user, surviving book): the one already
+        -- on the kept copy, else the oldest.
+        DELETE FROM ReadingList rl
+        USING duplicate_books d
+        WHERE rl.book_id = d.book_id
+          AND EXISTS (
+              SELECT 1
+              FROM ReadingList k
+              LEFT JOIN duplicate_books kd ON kd.book_id = k.book_id
+              WHERE k.user_id = rl.user_id
+                AND k.reading_list_id <> rl.reading_list_id
+                AND COALESCE(kd.keep_id, k.book_id) = d.keep_id
+                AND (k.book_id = d.keep_id OR k.reading_list_id < rl.reading_list_id)
+          );
+        UPDATE ReadingList rl SET book_id = d.keep_id
+        FROM duplicate_books d WHERE rl.book_id = d.book_id;
+
+        DELETE FROM Books b USING duplicate_books d WHERE b.book_id = d.book_id;
+
+        CREATE UNIQUE INDEX IF NOT EXISTS books_catalog_title_author_key
+            ON Books (title, author) WHERE user_id IS NULL;
+    """),
+    (6, "book search indexes", """
+        ALTER TABLE Books ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', author), 'B')
+            ) STORED;
+        CREATE INDEX IF NOT EXISTS books_search_vector_idx ON Books USING GIN (search_vector);
+
+        -- pg_trgm is a contrib module that not every server ships (or lets
+        -- the bot's role install); without it search stays full-text only.
+        DO $$
+        BEGIN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        EXCEPTION WHEN OTHERS THEN
+            RAISE NOTICE 'pg_trgm unavailable, fuzzy book search disabled: %', SQLERRM;
+        END
+        $$;
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+                EXECUTE 'CREATE INDEX IF NOT EXISTS books_title_trgm_idx ON Books USING GIN (title gin_trgm_ops)';
+                EXECUTE 'CREATE INDEX IF NOT EXISTS books_author_trgm_idx ON Books USING GIN (author gin_trgm_ops)';
+            END IF;
+        END
+        $$;
+    """),
+    # Seeded here rather than on every start: the version check then covers it too.
+    (7, "seed catalog", """
+        INSERT INTO Genres (genre_name)
+        VALUES ('Fiction'), ('History'), ('Self-Help')
+        ON CONFLICT (genre_name) DO NOTHING;
+
+        INSERT INTO Books (title, author, genre_id, publication_year, user_id, rating)
+        SELECT seed.title, seed.author, g.genre_id, seed.year, NULL, seed.rating
+        FROM (VALUES
+            ('1984', 'George Orwell', 'Fiction', 1949, 5),
+            ('Pride and Prejudice', 'Jane Austen', 'Fiction', 1813, 4),
+            ('Dune', 'Frank Herbert', 'Fiction', 1965, 5),
+            ('Sapiens', 'Yuval Noah Harari', 'History', 2011, 4),
+            ('The Guns of August', 'Barbara W. Tuchman', 'History', 1962, 3),
+            ('A People''s History of the United States', 'Howard Zinn', 'History', 1980, 4),
+            ('Atomic Habits', 'James Clear', 'Self-Help', 2018, 5),
+            ('The Power of Now', 'Eckhart Tolle', 'Self-Help', 1997, 4),
+            ('Mindset', 'Carol S. Dweck', 'Self-Help', 2006, 3)
+        ) AS seed (title, author, genre_name, year, rating)
+        JOIN Genres g ON g.genre_name = seed.genre_name
+        ON CONFLICT (title, author) WHERE user_id IS NULL DO NOTHING;
+    """),
+    (8, "recommender neighbor lists", """
+        CREATE TABLE IF NOT EXISTS book_neighbors (
+            book_id INTEGER PRIMARY KEY,
+            neighbor_ids INTEGER[] NOT NULL,
+            scores REAL[] NOT NULL
+        );
+    """),
+    # Concurrent multi-user writes (e.g. two Recommendations flushes) locked
+    # user_stats rows in hash order and could deadlock each other.
+    (9, "update user_stats rows in user_id order", """
+        CREATE OR REPLACE FUNCTION user_stats_apply() RETURNS trigger AS $$
+        BEGIN
+            EXECUTE format(
+                'INSERT INTO user_stats (user_id, %1$I)
+                 SELECT user_id, %2$s * COUNT(*) FROM changed_rows WHERE user_id IS NOT NULL
+                 GROUP BY user_id ORDER BY user_id
+                 ON CONFLICT (user_id) DO UPDATE SET %1$I = user_stats.%1$I + EXCLUDED.%1$I',
+                TG_ARGV[0], TG_ARGV[1]
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """),
+    # Seen-filter refreshes read one user's recent recommendations on every use.
+    (10, "index recommendations by user and time", """
+        CREATE INDEX IF NOT EXISTS recommendations_user_id_recommended_at_idx
+            ON Recommendations (user_id, recommended_at);
+        DROP INDEX IF EXISTS recommendations_user_id_idx;
+    """),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def current_version(conn):
+    try:
+        return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    except asyncpg.UndefinedTableError:
+        return 0
+
+
+async def migrate(conn):
+    """Apply pending migrations; a single SELECT when the schema is already current."""
+    version = await current_version(conn)
+    if version >= LATEST_VERSION:
+        return version
+
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+    try:
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        version = await current_version(conn)
+        for target, description, sql in MIGRATIONS:
+            if target <= version:
+                continue
+            async with conn.transaction():
+                await conn.execute(sql)
+                await conn.execute(
+                    "INSERT INTO schema_version (version, description) VALUES ($1, $2)", target, description
+                )
+            logger.info(f"Applied migration {target}: {description}")
+            version = target
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+    return version
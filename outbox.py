@@ -0,0 +1,225 @@
+"""Outbound send scheduler.
+
+Handlers queue Bot API calls (SendMessage, EditMessageText, ...) and return
+straight away; a pool of workers delivers them within Telegram's limits:
+a global token bucket (~30 msg/s per bot) and one per chat (about 1 msg/s
+in private chats, 20/min in groups). Messages to one chat are sent in
+order. A 429 pauses every send for `retry_after` before the message is
+retried; network and 5xx errors are retried with backoff; anything else
+(bot blocked, bad request) is logged and dropped.
+
+The limits apply to the bot as a whole, so processes sharing the token
+must split the global rate between them (set_global_rate()).
+
+Most replies are followed by a "Back to main menu:" message whose only job
+is to bring the reply keyboard back. menu() skips it when the chat already
+shows that keyboard, or attaches the keyboard to the queued reply when the
+reply carries no markup of its own. Which keyboard a chat shows is tracked
+per process for SEND_KEYBOARD_TTL seconds, from the keyboards we send and
+from the user tapping one of its buttons.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import SendMessage
+from aiogram.types import ReplyKeyboardMarkup, ReplyKeyboardRemove
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))
+GROUP_RATE = float(os.getenv("SEND_GROUP_RATE_PER_MIN", "20")) / 60
+WORKERS = int(os.getenv("SEND_WORKERS", "16"))
+MAX_PENDING = int(os.getenv("SEND_MAX_PENDING", "10000"))
+MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))
+KEYBOARD_TTL = float(os.getenv("SEND_KEYBOARD_TTL", "600"))
+MAX_CHATS = int(os.getenv("SEND_MAX_CHATS", "100000"))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def reserve(self, now: float):
+        """Take a token, possibly on credit; returns how long to wait before using it."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class SendScheduler:
+    def __init__(self, bot, global_rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE,
+                 chat_burst: float = CHAT_BURST, group_rate: float = GROUP_RATE, workers: int = WORKERS,
+                 max_pending: int = MAX_PENDING, max_retries: int = MAX_RETRIES,
+                 keyboard_ttl: float = KEYBOARD_TTL, max_chats: int = MAX_CHATS):
+        self.bot = bot
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.workers = workers
+        self.max_retries = max_retries
+        self.keyboard_ttl = keyboard_ttl
+        self.max_chats = max_chats
+        self._global = TokenBucket(global_rate, global_rate, time.monotonic())
+        self._paused_until = 0.0
+        self._buckets = OrderedDict()
+        self._keyboards = OrderedDict()
+        self._chats = {}
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max_pending)
+        self._tasks = []
+        self.pending = 0
+        self.sent = 0
+        self.merged = 0
+        self.skipped = 0
+        self.retried = 0
+        self.failed = 0
+
+    def metrics(self):
+        return {
+            "pending": self.pending,
+            "sent": self.sent,
+            "merged": self.merged,
+            "skipped": self.skipped,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def set_global_rate(self, rate: float):
+        self.global_rate = rate
+        self._global = TokenBucket(rate, max(1.0, rate), time.monotonic())
+
+    def note_keyboard(self, chat_id: int, markup):
+        """Record that the chat shows reply keyboard `markup` (sent by us or implied by the user's tap)."""
+        self._keyboards[chat_id] = (markup, time.monotonic())
+        self._keyboards.move_to_end(chat_id)
+        if len(self._keyboards) > self.max_chats:
+            self._keyboards.popitem(last=False)
+
+    def _shown_keyboard(self, chat_id: int):
+        entry = self._keyboards.get(chat_id)
+        if entry is None or time.monotonic() - entry[1] >= self.keyboard_ttl:
+            return None
+        return entry[0]
+
+    async def send(self, method):
+        """Queue a bound Bot API call, e.g. send(message.answer(...)); waits only when the queue is full."""
+        await self._slots.acquire()
+        self.pending += 1
+        chat_id = method.chat_id
+        if isinstance(getattr(method, "reply_markup", None), (ReplyKeyboardMarkup, ReplyKeyboardRemove)):
+            self.note_keyboard(chat_id, method.reply_markup)
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            queue = self._chats[chat_id] = deque()
+            self._ready.put_nowait(chat_id)
+        queue.append(method)
+
+    async def menu(self, chat_id: int, text: str, keyboard):
+        """Make sure the chat ends up showing the reply `keyboard`, with as few sends as possible."""
+        if self._shown_keyboard(chat_id) is keyboard:
+            self.skipped += 1
+            return
+        queue = self._chats.get(chat_id)
+        if queue and isinstance(queue[-1], SendMessage) and queue[-1].reply_markup is None:
+            queue[-1].reply_markup = keyboard
+            self.note_keyboard(chat_id, keyboard)
+            self.merged += 1
+            return
+        await self.send(SendMessage(chat_id=chat_id, text=text, reply_markup=keyboard).as_(self.bot))
+
+    def _chat_bucket(self, chat_id: int, now: float):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = self._buckets[chat_id] = TokenBucket(rate, self.chat_burst, now)
+            if len(self._buckets) > self.max_chats:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _throttle(self, chat_id: int):
+        now = time.monotonic()
+        while now < self._paused_until:
+            await asyncio.sleep(self._paused_until - now)
+            now = time.monotonic()
+        delay = self._chat_bucket(chat_id, now).reserve(now)
+        if delay:
+            await asyncio.sleep(delay)
+            now = time.monotonic()
+        delay = self._global.reserve(now)
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def _deliver(self, method):
+        chat_id = method.chat_id
+        for attempt in range(self.max_retries + 1):
+            await self._throttle(chat_id)
+            try:
+                await self.bot(method)
+                self.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                # Telegram wants the whole bot to back off, not just this chat.
+                logger.warning(f"Flood limit on chat {chat_id}, pausing all sends for {e.retry_after}s")
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                delay = 0
+            except (TelegramNetworkError, TelegramServerError) as e:
+                delay = min(30, 2 ** attempt)
+                logger.warning(f"{type(method).__name__} to chat {chat_id} failed ({e}), retrying in {delay}s")
+            except TelegramAPIError as e:
+                self.failed += 1
+                logger.warning(f"Dropped {type(method).__name__} to chat {chat_id}: {e}")
+                return
+            self.retried += 1
+            await asyncio.sleep(delay)
+        self.failed += 1
+        logger.error(f"Gave up on {type(method).__name__} to chat {chat_id} after {self.max_retries} retries")
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            queue = self._chats[chat_id]
+            method = queue.popleft()
+            try:
+                await self._deliver(method)
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Unexpected error sending to chat {chat_id}")
+            finally:
+                self.pending -= 1
+                self._slots.release()
+                # One message per turn keeps a busy chat from starving the others.
+                if queue:
+                    self._ready.put_nowait(chat_id)
+                else:
+                    del self._chats[chat_id]
+
+    async def close(self, timeout: float = 10.0):
+        deadline = time.monotonic() + timeout
+        while self.pending and self._tasks and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.pending:
+            logger.error(f"Send queue closed with {self.pending} messages undelivered")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Send scheduler closed: {self.metrics()}")
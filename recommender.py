@@ -0,0 +1,204 @@
+"""Item-item collaborative filtering over ratings and reading-list history.
+
+The model is rebuilt offline by this module's CLI, not by the bot:
+
+    python recommender.py [--interval SECONDS]
+
+It streams a sparse user x book interaction matrix out of Books.rating,
+ReadingList and Recommendations with COPY. Then it computes item-item
+cosine similarity in blocks, keeps the top `neighbors` per book, and
+publishes the lists to the book_neighbors table (migration 8). The build
+runs in a child process on its own connection, so its peak memory goes
+back to the OS when the build ends.
+
+Bot processes hold no model. A lookup scores the neighbors of the user's
+most recent ratings and reading-list books in one query, which costs
+O(history x neighbors). Users without history get nothing and fall back
+to random sampling. NumPy/SciPy are only needed for the rebuild.
+"""
+import argparse
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+    sparse = None
+
+import asyncpg
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# 0 rebuilds once and exits, e.g. from cron.
+REBUILD_INTERVAL = float(os.getenv("RECOMMENDER_REBUILD_INTERVAL", "0"))
+NEIGHBORS = int(os.getenv("RECOMMENDER_NEIGHBORS", "50"))
+TOP_N = int(os.getenv("RECOMMENDER_TOP_N", "30"))
+BLOCK_SIZE = int(os.getenv("RECOMMENDER_BLOCK_SIZE", "2048"))
+# Per source, the most recent ratings and reading-list adds scored at lookup.
+HISTORY = int(os.getenv("RECOMMENDER_HISTORY", "50"))
+
+# Interaction weights: an explicit rating counts rating/5, a reading-list
+# add is a strong signal, having been shown a book is a weak one.
+READING_LIST_WEIGHT = 1.0
+RECOMMENDED_WEIGHT = 0.1
+
+AVAILABLE = np is not None
+
+INTERACTIONS_SQL = """
+    SELECT user_id, book_id, rating / 5.0 FROM Books WHERE user_id IS NOT NULL AND rating IS NOT NULL
+    UNION ALL
+    SELECT user_id, book_id, $1::float8 FROM ReadingList
+    UNION ALL
+    SELECT user_id, book_id, $2::float8 * COUNT(*) FROM Recommendations GROUP BY user_id, book_id
+"""
+
+
+def _top_k_per_row(matrix, k: int):
+    """Keep only the k largest entries of every CSR row."""
+    matrix = matrix.tocsr()
+    indptr, data = matrix.indptr, matrix.data
+    for row in np.flatnonzero(np.diff(indptr) > k):
+        segment = data[indptr[row]:indptr[row + 1]]
+        segment[np.argpartition(segment, -k)[:-k]] = 0
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def item_similarity(interactions, neighbors: int = NEIGHBORS, block_size: int = BLOCK_SIZE):
+    """Top-`neighbors` cosine similarity between the columns of a users x items matrix."""
+    normalized = interactions.tocsc().astype(np.float32)
+    norms = np.sqrt(normalized.multiply(normalized).sum(axis=0)).A1
+    norms[norms == 0] = 1.0
+    normalized = normalized @ sparse.diags(1.0 / norms)
+    item_user = normalized.T.tocsr()
+    user_item = normalized.tocsc()
+
+    blocks = []
+    for start in range(0, item_user.shape[0], block_size):
+        block = (item_user[start:start + block_size] @ user_item).tocoo()
+        off_diagonal = block.row + start != block.col
+        block = sparse.csr_matrix(
+            (block.data[off_diagonal], (block.row[off_diagonal], block.col[off_diagonal])), shape=block.shape
+        )
+        blocks.append(_top_k_per_row(block, neighbors))
+    return sparse.vstack(blocks, format="csr")
+
+
+def build_model(user_ids, book_ids, weights, neighbors: int = NEIGHBORS, block_size: int = BLOCK_SIZE):
+    """Neighbor lists from parallel interaction arrays.
+
+    Returns (book_ids, indptr, neighbor_ids, scores): the neighbors of
+    book_ids[i] are neighbor_ids[indptr[i]:indptr[i + 1]], best first.
+    """
+    users, user_index = np.unique(np.asarray(user_ids, dtype=np.int64), return_inverse=True)
+    items, item_index = np.unique(np.asarray(book_ids, dtype=np.int64), return_inverse=True)
+    interactions = sparse.csr_matrix(
+        (np.asarray(weights, dtype=np.float32), (user_index, item_index)),
+        shape=(len(users), len(items))
+    )
+    interactions.sum_duplicates()
+    similarity = item_similarity(interactions, neighbors, block_size)
+
+    indptr = similarity.indptr
+    rows = np.repeat(np.arange(similarity.shape[0]), np.diff(indptr))
+    order = np.lexsort((-similarity.data, rows))
+    return items, indptr, items[similarity.indices[order]], similarity.data[order]
+
+
+def neighbor_records(book_ids, indptr, neighbor_ids, scores):
+    """book_neighbors rows, skipping books without neighbors."""
+    for row, book_id in enumerate(book_ids.tolist()):
+        start, end = indptr[row], indptr[row + 1]
+        if start < end:
+            yield book_id, neighbor_ids[start:end].tolist(), scores[start:end].tolist()
+
+
+async def load_interactions(conn):
+    """Interaction arrays (user_ids, book_ids, weights), streamed out with COPY."""
+    buffer = io.BytesIO()
+    await conn.copy_from_query(INTERACTIONS_SQL, READING_LIST_WEIGHT, RECOMMENDED_WEIGHT,
+                               output=buffer, format="csv")
+    if not buffer.tell():
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+    buffer.seek(0)
+    table = np.loadtxt(buffer, delimiter=",", ndmin=2, dtype=np.float64)
+    return table[:, 0].astype(np.int64), table[:, 1].astype(np.int64), table[:, 2]
+
+
+async def publish(conn, book_ids, indptr, neighbor_ids, scores):
+    """Replace the published neighbor lists; readers keep the old ones until commit."""
+    async with conn.transaction():
+        await conn.execute("DELETE FROM book_neighbors")
+        await conn.copy_records_to_table(
+            "book_neighbors", records=neighbor_records(book_ids, indptr, neighbor_ids, scores),
+            columns=("book_id", "neighbor_ids", "scores")
+        )
+
+
+async def rebuild(conn):
+    """Load, build in a child process, publish; returns the number of books with neighbors."""
+    start = time.perf_counter()
+    user_ids, book_ids, weights = await load_interactions(conn)
+    if not len(user_ids):
+        logger.info("Recommender rebuild skipped: no interactions yet")
+        return 0
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        model = await loop.run_in_executor(executor, build_model, user_ids, book_ids, weights)
+    await publish(conn, *model)
+    books = int((np.diff(model[1]) > 0).sum())
+    logger.info(
+        f"Recommender rebuilt from {len(user_ids)} interactions: "
+        f"{books} books with neighbors in {time.perf_counter() - start:.2f}s"
+    )
+    return books
+
+
+async def recommend(user_id: int, genre_name: str, limit: int, exclude=None):
+    """Top unseen books in a genre for the user; empty for users without history.
+
+    With `exclude`, skips excluded ids among the TOP_N best candidates.
+    """
+    books = await db.fetch_books(
+        "neighbor_recommendations", user_id, genre_name, HISTORY, TOP_N, READING_LIST_WEIGHT
+    )
+    if exclude is not None:
+        books = [book for book in books if not exclude(book.book_id)]
+    return books[:limit]
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the item-item recommender")
+    parser.add_argument("--interval", type=float, default=REBUILD_INTERVAL,
+                        help="keep rebuilding every INTERVAL seconds; 0 rebuilds once")
+    args = parser.parse_args(argv)
+    if not AVAILABLE:
+        raise SystemExit("The recommender rebuild needs numpy and scipy")
+    while True:
+        # A dedicated connection: the rebuild's queries outlast DB_COMMAND_TIMEOUT.
+        conn = await asyncpg.connect(**db.DB_CONFIG)
+        try:
+            await rebuild(conn)
+        except Exception as e:
+            if not args.interval:
+                raise
+            logger.error(f"Recommender rebuild failed: {e}")
+        finally:
+            await conn.close()
+        if not args.interval:
+            return
+        await asyncio.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,216 @@
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+
+from books import Book
+from callbacks import AddReading, DeleteBook, UpdateBook, UpdateField
+
+MESSAGE_LIMIT = 4096
+
+MENU_RECOMMENDATIONS = "📚 Get Recommendations"
+MENU_ADD_BOOK = "➕ Add Book"
+MENU_MY_BOOKS = "📖 My Books"
+MENU_SURPRISE = "⭐ Surprise Me!"
+MENU_READING_LIST = "📋 My Reading List"
+MENU_STATS = "📊 My Stats"
+
+# Static keyboards are built once and shared by every handler; never mutate them.
+MAIN_MENU = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text=MENU_RECOMMENDATIONS), KeyboardButton(text=MENU_ADD_BOOK)],
+        [KeyboardButton(text=MENU_MY_BOOKS), KeyboardButton(text=MENU_SURPRISE)],
+        [KeyboardButton(text=MENU_READING_LIST), KeyboardButton(text=MENU_STATS)]
+    ],
+    resize_keyboard=True
+)
+
+UPDATE_FIELDS_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Title", callback_data=UpdateField(field="title").pack())],
+    [InlineKeyboardButton(text="Author", callback_data=UpdateField(field="author").pack())],
+    [InlineKeyboardButton(text="Genre", callback_data=UpdateField(field="genre").pack())],
+    [InlineKeyboardButton(text="Year", callback_data=UpdateField(field="year").pack())],
+    [InlineKeyboardButton(text="Rating", callback_data=UpdateField(field="rating").pack())]
+])
+
+def format_book(book, with_genre: bool = True):
+    return _book_lines((book,), with_genre)[0]
+
+
+def escape_markdown(text: str):
+    """Escape user text for legacy Markdown so it cannot break the entities around it."""
+    for char in ("_", "*", "`", "["):
+        text = text.replace(char, "\\" + char)
+    return text
+
+
+def shorten(text: str, size: int):
+    return text if len(text) <= size else text[:max(0, size - 1)] + "…"
+
+
+def split_message(lines, limit: int = MESSAGE_LIMIT):
+    """Join lines into as few messages as possible, each at most `limit` chars.
+
+    A line longer than `limit` is cut, which can break its Markdown; book
+    lines are shortened before formatting instead (see render_books()).
+    """
+    text = "\n".join(lines)
+    if len(text) <= limit:
+        return [text]
+    chunks = []
+    current = []
+    size = 0
+    for line in lines:
+        if len(line) > limit:
+            line = line[:limit - 1] + "…"
+        added = len(line) + (1 if current else 0)
+        if current and size + added > limit:
+            chunks.append("\n".join(current))
+            current = []
+            added = len(line)
+            size = 0
+        current.append(line)
+        size += added
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _split_text(text: str, limit: int):
+    """split_message() on already joined text, cutting at the last newline that fits; None if a line is too long."""
+    chunks = []
+    start = 0
+    while len(text) - start > limit:
+        cut = text.rfind("\n", start, start + limit + 1)
+        if cut < start:
+            return None
+        chunks.append(text[start:cut])
+        start = cut + 1
+    chunks.append(text[start:])
+    return chunks
+
+
+def _book_lines(books, with_genre: bool):
+    """The one book line layout, shared by format_book() and the list renderers."""
+    separator = ", " if with_genre else ""
+    return [
+        f"📖 *{book.title}* by {book.author} ({book.publication_year}, "
+        f"{book.genre_name if with_genre else ''}{separator}"
+        f"Rating: {'Unrated' if book.rating is None else book.rating}/5)"
+        for book in books
+    ]
+
+
+def _fit_lines(lines, books, with_genre: bool, budget: int):
+    """Re-format the books whose line is over `budget` chars with a shorter title and author.
+
+    Cutting the fields rather than the finished line keeps the *title* entity whole.
+    """
+    if max(map(len, lines), default=0) <= budget:
+        return lines
+    for i, line in enumerate(lines):
+        if len(line) <= budget:
+            continue
+        book = books[i]
+        room = max(2, budget - (len(line) - len(book.title) - len(book.author)))
+        author_room = min(len(book.author), max(1, room // 3))
+        title_room = room - author_room
+        author_room = room - min(len(book.title), title_room)
+        short = Book(book.book_id, shorten(book.title, title_room), shorten(book.author, author_room),
+                     book.publication_year, book.rating, book.genre_name)
+        lines[i] = _book_lines((short,), with_genre)[0]
+    return lines
+
+
+def render_books(header: str, books, with_genre: bool = True):
+    """The list as one message when it fits (the common case), else split across as few as possible."""
+    lines = _book_lines(books, with_genre)
+    text = f"{header}\n\n" + "\n".join(lines) if lines else f"{header}\n"
+    if len(text) <= MESSAGE_LIMIT:
+        return [text]
+    chunks = _split_text(text, MESSAGE_LIMIT)
+    if chunks is None:
+        chunks = split_message([header, "", *_fit_lines(lines, books, with_genre, MESSAGE_LIMIT)])
+    return chunks
+
+
+def render_stats(stats):
+    return "\n".join((
+        "Your stats:",
+        "",
+        f"📚 Books added: {stats['books_added']}",
+        f"✅ Recommendations received: {stats['recommendations_received']}",
+        f"📋 Reading list items: {stats['reading_list_count']}",
+    ))
+
+
+def reading_list_keyboard(books):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"Add {book.title} to Reading List",
+                              callback_data=AddReading(book_id=book.book_id).pack())]
+        for book in books
+    ])
+
+
+def surprise_keyboard(book):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Add to Reading List", callback_data=AddReading(book_id=book.book_id).pack())]
+    ])
+
+
+def pagination_row(page_data, books, has_prev: bool, has_next: bool):
+    """Keyset Prev/Next buttons; `page_data` is a CallbackData class with backward and cursor fields."""
+    row = []
+    if has_prev:
+        callback_data = page_data(backward=True, cursor=books[0].book_id).pack()
+        row.append(InlineKeyboardButton(text="⬅️ Prev", callback_data=callback_data))
+    if has_next:
+        callback_data = page_data(backward=False, cursor=books[-1].book_id).pack()
+        row.append(InlineKeyboardButton(text="Next ➡️", callback_data=callback_data))
+    return row
+
+
+def pagination_keyboard(page_data, books, has_prev: bool, has_next: bool):
+    row = pagination_row(page_data, books, has_prev, has_next)
+    return InlineKeyboardMarkup(inline_keyboard=[row]) if row else None
+
+
+def page_row(page_data, page: int, has_prev: bool, has_next: bool):
+    """Numbered Prev/Next buttons; `page_data(page=n)` builds the CallbackData for page n."""
+    row = []
+    if has_prev:
+        row.append(InlineKeyboardButton(text="⬅️ Prev", callback_data=page_data(page=page - 1).pack()))
+    if has_next:
+        row.append(InlineKeyboardButton(text="Next ➡️", callback_data=page_data(page=page + 1).pack()))
+    return row
+
+
+def search_keyboard(books, nav_row=None):
+    rows = reading_list_keyboard(books).inline_keyboard
+    if nav_row:
+        rows = rows + [nav_row]
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def book_actions_keyboard(books, nav_row=None):
+    rows = [
+        [
+            InlineKeyboardButton(text=f"Update {book.title}", callback_data=UpdateBook(book_id=book.book_id).pack()),
+            InlineKeyboardButton(text=f"Delete {book.title}", callback_data=DeleteBook(book_id=book.book_id).pack())
+        ]
+        for book in books
+    ]
+    if nav_row:
+        rows.append(nav_row)
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def render_page(header: str, books, with_genre: bool = True):
+    """A page is always edited in place, so it has to fit in a single message.
+
+    Every book keeps its line (its buttons are on the page too); long titles
+    and authors are shortened to an equal share of the message instead.
+    """
+    lines = _book_lines(books, with_genre)
+    text = f"{header}\n\n" + "\n".join(lines) if lines else f"{header}\n"
+    if len(text) <= MESSAGE_LIMIT or not books:
+        return text[:MESSAGE_LIMIT]
+    budget = (MESSAGE_LIMIT - len(header) - 2) // len(books) - 1
+    return header + "\n\n" + "\n".join(_fit_lines(lines, books, with_genre, budget))
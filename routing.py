@@ -0,0 +1,74 @@
+"""O(1) route tables for the Dispatcher.
+
+aiogram tries handlers one after another, running each filter until one
+matches. For the hot paths the bot registers a single handler per table
+instead: the table's filter does one dict lookup (menu text, FSM state, or
+callback prefix) and hands the matched function to the handler as `route`.
+Callback payloads are unpacked once, in the filter, into `callback_data`.
+"""
+from aiogram.filters import Filter
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery, Message
+
+
+class _Routes(Filter):
+    def __init__(self):
+        self._routes = {}
+
+    def __len__(self):
+        return len(self._routes)
+
+    def _add(self, key, value):
+        if key in self._routes:
+            raise ValueError(f"Duplicate route {key!r}")
+        self._routes[key] = value
+
+
+class TextRoutes(_Routes):
+    """Exact message text -> handler(message, state); used for the reply-keyboard menu."""
+
+    def route(self, text: str):
+        def register(handler):
+            self._add(text, handler)
+            return handler
+        return register
+
+    async def __call__(self, message: Message):
+        handler = self._routes.get(message.text)
+        return False if handler is None else {"route": handler}
+
+
+class StateRoutes(_Routes):
+    """FSM state -> handler(message, state)."""
+
+    def route(self, state: State):
+        def register(handler):
+            self._add(state.state, handler)
+            return handler
+        return register
+
+    async def __call__(self, message: Message, raw_state: str = None):
+        handler = self._routes.get(raw_state)
+        return False if handler is None else {"route": handler}
+
+
+class CallbackRoutes(_Routes):
+    """CallbackData prefix -> handler(callback, callback_data, state)."""
+
+    def route(self, factory):
+        def register(handler):
+            self._add(factory.__prefix__, (factory, handler))
+            return handler
+        return register
+
+    async def __call__(self, callback: CallbackQuery):
+        data = callback.data or ""
+        entry = self._routes.get(data.partition(":")[0])
+        if entry is None:
+            return False
+        factory, handler = entry
+        try:
+            callback_data = factory.unpack(data)
+        except (TypeError, ValueError):
+            return False
+        return {"route": handler, "callback_data": callback_data}
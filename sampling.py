@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import random
+from array import array
+
+import db
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = float(os.getenv("SAMPLER_REFRESH_INTERVAL", "30"))
+FULL_RELOAD_INTERVAL = float(os.getenv("SAMPLER_FULL_RELOAD_INTERVAL", "3600"))
+
+
+class GenreSampler:
+    """In-process per-genre pools of book ids for O(k) random picks.
+
+    New books are pulled incrementally by book_id watermark; deleted or
+    re-genred books are dropped lazily when a pick no longer matches.
+    """
+
+    def __init__(self, rng=None):
+        self._pools = {}
+        self._watermark = 0
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self._rng = rng or random.Random()
+        self._refresher = None
+        self._stale = False
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._pools.values())
+
+    def add(self, genre_name: str, book_id: int):
+        self._pools.setdefault(genre_name, array("l")).append(book_id)
+
+    def discard(self, genre_name: str, book_id: int):
+        ids = self._pools.get(genre_name)
+        if ids is None:
+            return
+        try:
+            ids.remove(book_id)
+        except ValueError:
+            pass
+
+    async def refresh(self, full: bool = False):
+        async with self._lock:
+            watermark = 0 if full else self._watermark
+            rows = await db.fetch("genre_book_ids_since", watermark)
+            pools = {} if full else self._pools
+            added = 0
+            for row in rows:
+                pools.setdefault(row['genre_name'], array("l")).extend(row['book_ids'])
+                added += len(row['book_ids'])
+                watermark = max(watermark, row['max_book_id'])
+            self._watermark = watermark
+            self._pools = pools
+            self._loaded = True
+            logger.info(f"Genre sampler refreshed ({'full' if full else 'incremental'}): {added} ids, {len(self)} total")
+
+    def refresh_soon(self):
+        """Pull new books in the background, e.g. right after one was added.
+
+        Calls made while a refresh is running trigger one more refresh after it,
+        so a book committed just after that refresh read its rows is still picked up.
+        """
+        self._stale = True
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_stale())
+
+    async def _refresh_stale(self):
+        while self._stale:
+            self._stale = False
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Genre sampler refresh failed: {e}")
+
+    async def close(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+    async def run(self, interval: float = REFRESH_INTERVAL, full_interval: float = FULL_RELOAD_INTERVAL):
+        loop = asyncio.get_running_loop()
+        last_full = loop.time()
+        while True:
+            await asyncio.sleep(interval)
+            full = loop.time() - last_full >= full_interval
+            try:
+                await self.refresh(full=full)
+            except Exception as e:
+                logger.error(f"Genre sampler refresh failed: {e}")
+                continue
+            if full:
+                last_full = loop.time()
+
+    def _pick_ids(self, ids, k: int):
+        if k >= len(ids):
+            return list(ids)
+        return self._rng.sample(ids, k)
+
+    async def sample(self, genre_name: str, limit: int, exclude=None, max_rounds: int = 8):
+        """Up to `limit` distinct live books; ids for which `exclude(id)` is true are skipped."""
+        ids = self._pools.get(genre_name)
+        picked = []
+        tried = set()
+        rounds = 0
+        while ids and len(picked) < limit and len(tried) < len(ids) and rounds < max_rounds:
+            rounds += 1
+            want = limit - len(picked)
+            candidates = []
+            for book_id in self._pick_ids(ids, min(len(ids), 2 * want + len(tried))):
+                if book_id in tried:
+                    continue
+                tried.add(book_id)
+                if exclude is not None and exclude(book_id):
+                    continue
+                candidates.append(book_id)
+                if len(candidates) == want:
+                    break
+            if not candidates:
+                continue
+            books = await db.fetch_books("books_by_ids", candidates)
+            found = set()
+            for book in books:
+                if book.genre_name == genre_name:
+                    picked.append(book)
+                    found.add(book.book_id)
+            for book_id in candidates:
+                if book_id not in found:
+                    self.discard(genre_name, book_id)
+        return picked
+
+    async def sample_any(self, exclude=None):
+        genres = [genre for genre, ids in self._pools.items() if ids]
+        if not genres:
+            return None
+        for _ in range(3):
+            genre = self._rng.choices(genres, weights=[len(self._pools[g]) for g in genres])[0]
+            books = await self.sample(genre, 1, exclude)
+            if books:
+                return books[0]
+        return None
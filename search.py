@@ -0,0 +1,141 @@
+"""Ranked book search by title and author.
+
+Full-text matching runs on the Books.search_vector GIN index (migration 6),
+with every query word treated as a prefix. When pg_trgm is installed the
+full-text hits are topped up with trigram word-similarity matches, which
+catches typos ("dnue" -> "Dune"); without it search is full-text only.
+
+Each distinct query is run once for up to SEARCH_MAX_RESULTS rows and kept
+in a small LRU, so paging through results and the bursts of inline queries
+sent while a user types are served from memory. Page buttons carry the
+normalized query itself, so a tap that lands on another worker, or after
+the entry expired, simply runs the query again.
+"""
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+
+from books import decode_books
+import db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "50"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1000"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+SEARCH_MAX_TERMS = 8
+# Queries travel in search page buttons (callbacks.SearchPage) and Telegram
+# caps callback data at 64 bytes.
+SEARCH_QUERY_MAX_BYTES = 48
+
+# Not in db.QUERIES: these operators only exist once pg_trgm is installed,
+# so the query is only ever sent after detect() has found the extension.
+FUZZY_SEARCH_SQL = f"""
+    SELECT {db.BOOK_COLUMNS}, g.genre_name
+    FROM Books b
+    LEFT JOIN Genres g ON b.genre_id = g.genre_id
+    WHERE b.title %> $1 OR b.author %> $1
+    ORDER BY GREATEST(word_similarity($1, b.title), word_similarity($1, b.author)) DESC, b.book_id
+    LIMIT $2
+"""
+
+_TERM = re.compile(r"\w+")
+
+
+def normalize_query(text: str):
+    """Lower-cased words of `text`, as many whole words as fit in SEARCH_QUERY_MAX_BYTES."""
+    query = ""
+    for term in _TERM.findall(text.lower())[:SEARCH_MAX_TERMS]:
+        candidate = f"{query} {term}" if query else term
+        if len(candidate.encode()) > SEARCH_QUERY_MAX_BYTES:
+            if not query:
+                # Words are matched as prefixes, so a cut-down word still finds the book.
+                query = term.encode()[:SEARCH_QUERY_MAX_BYTES].decode(errors="ignore")
+            break
+        query = candidate
+    return query
+
+
+def prefix_tsquery(query: str):
+    """'dune herb' -> 'dune:* & herb:*'; words are already stripped of tsquery syntax."""
+    return " & ".join(f"{term}:*" for term in query.split())
+
+
+class BookSearch:
+    def __init__(self, max_results: int = SEARCH_MAX_RESULTS, cache_size: int = SEARCH_CACHE_SIZE,
+                 cache_ttl: float = SEARCH_CACHE_TTL):
+        self.max_results = max_results
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.fuzzy = False
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    async def detect(self):
+        """Enable trigram matching if pg_trgm is installed in this database."""
+        async with db.acquire() as conn:
+            self.fuzzy = await conn.fetchval("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+        if not self.fuzzy:
+            logger.warning("pg_trgm is not installed; book search is full-text only")
+        return self.fuzzy
+
+    def metrics(self):
+        return {"cache_hits": self.hits, "cache_misses": self.misses, "cache_size": len(self._cache)}
+
+    def _cached(self, query: str):
+        entry = self._cache.get(query)
+        if entry is None:
+            return None
+        books, cached_at = entry
+        if time.monotonic() - cached_at >= self.cache_ttl:
+            del self._cache[query]
+            return None
+        self._cache.move_to_end(query)
+        return books
+
+    def _remember(self, query: str, books):
+        self._cache[query] = (books, time.monotonic())
+        self._cache.move_to_end(query)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _run(self, query: str):
+        books = await db.fetch_books("search_books", prefix_tsquery(query), self.max_results)
+        if self.fuzzy and len(books) < self.max_results:
+            found = {book.book_id for book in books}
+            async with db.acquire() as conn:
+                start = time.perf_counter()
+                fuzzy = decode_books(await conn.fetch(FUZZY_SEARCH_SQL, query, self.max_results))
+                metrics.observe_query("search_books_fuzzy", time.perf_counter() - start)
+            books += [book for book in fuzzy if book.book_id not in found][:self.max_results - len(books)]
+        return books
+
+    async def _results(self, query: str):
+        books = self._cached(query)
+        if books is not None:
+            self.hits += 1
+            return books
+        self.misses += 1
+        books = await self._run(query)
+        self._remember(query, books)
+        return books
+
+    async def search(self, text: str):
+        """(normalized query, ranked books) for free text; the query is empty when it has no words."""
+        query = normalize_query(text)
+        if not query:
+            return query, []
+        return query, await self._results(query)
+
+    async def page(self, query: str, page: int, page_size: int):
+        """(books, has_prev, has_next) for a normalized query, run again if it is no longer cached."""
+        books = await self._results(query)
+        start = page * page_size
+        return books[start:start + page_size], page > 0, len(books) > start + page_size
+
+    def invalidate(self):
+        self._cache.clear()
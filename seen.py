@@ -0,0 +1,188 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import db
+
+SEEN_WINDOW = float(os.getenv("SEEN_WINDOW_DAYS", "30")) * 86400
+SEEN_FALSE_POSITIVE = float(os.getenv("SEEN_FALSE_POSITIVE", "0.01"))
+SEEN_FILTER_HASHES = int(os.getenv("SEEN_FILTER_HASHES", str(round(-math.log2(SEEN_FALSE_POSITIVE)))))
+# Per generation; both are rounded up to a power of two.
+SEEN_FILTER_MIN_BITS = int(os.getenv("SEEN_FILTER_MIN_BITS", "1024"))
+SEEN_FILTER_MAX_BITS = int(os.getenv("SEEN_FILTER_MAX_BITS", "65536"))
+SEEN_MAX_USERS = int(os.getenv("SEEN_MAX_USERS", "100000"))
+# With several webhook workers, how often a served filter picks up books other
+# workers recommended (0: before every use). The overlap covers rows still in
+# another worker's write buffer, stamped before they reach the table.
+SEEN_WORKER_REFRESH = float(os.getenv("SEEN_WORKER_REFRESH_INTERVAL", "0"))
+SEEN_REFRESH_OVERLAP = float(os.getenv("SEEN_REFRESH_OVERLAP", "10"))
+
+_MASK_64 = (1 << 64) - 1
+
+
+def _mix(x: int):
+    """splitmix64's finalizer: every output bit depends on every input bit."""
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK_64
+    return x ^ (x >> 31)
+
+
+def _power_of_two(n: int):
+    return 1 << max(3, (n - 1).bit_length())
+
+
+def _shift(generation: bytearray):
+    # A generation of 2**b bits is indexed by the top b bits of a 64-bit hash.
+    return 65 - (len(generation) * 8).bit_length()
+
+
+class SeenFilter:
+    """Bloom filter of book ids with two rotating generations.
+
+    Each generation covers half the decay window; a book counts as seen if
+    either generation has it, so entries expire after window/2..window.
+    False positives only ever hide a book, never show a repeat.
+    """
+
+    __slots__ = ("hashes", "current", "previous", "count", "rotated_at", "loaded", "refreshed_at")
+
+    def __init__(self, bits: int, hashes: int, now: float):
+        self.hashes = hashes
+        self.current = bytearray(_power_of_two(bits) // 8)
+        self.previous = bytearray(1)
+        self.count = 0
+        self.rotated_at = now
+        self.loaded = False
+        self.refreshed_at = now
+
+    def _hashes(self, book_id: int):
+        h1 = _mix(book_id)
+        h2 = _mix(h1) | 1
+        return [(h1 + i * h2) & _MASK_64 for i in range(self.hashes)]
+
+    def reserve(self, bits: int):
+        """Regrow the still empty current generation to `bits`."""
+        if self.count == 0:
+            self.current = bytearray(_power_of_two(bits) // 8)
+
+    def rotate(self, now: float, half_window: float, bits: int):
+        if now - self.rotated_at < half_window:
+            return
+        if now - self.rotated_at >= 2 * half_window:
+            self.previous = bytearray(1)
+        else:
+            self.previous = self.current
+        self.current = bytearray(_power_of_two(bits) // 8)
+        self.count = 0
+        self.rotated_at = now
+
+    def add(self, book_id: int):
+        current = self.current
+        shift = _shift(current)
+        for h in self._hashes(book_id):
+            position = h >> shift
+            current[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, book_id: int):
+        current, previous = self.current, self.previous
+        current_shift, previous_shift = _shift(current), _shift(previous)
+        in_current = in_previous = True
+        for h in self._hashes(book_id):
+            position = h >> current_shift
+            in_current = in_current and bool(current[position >> 3] & (1 << (position & 7)))
+            position = h >> previous_shift
+            in_previous = in_previous and bool(previous[position >> 3] & (1 << (position & 7)))
+            if not (in_current or in_previous):
+                return False
+        return True
+
+
+class SeenTracker:
+    """Per-user seen sets for excluding already recommended or saved books.
+
+    Filters live in memory, bounded by an LRU over users, and are warmed
+    from the user's recent history the first time the user is served.
+    Memory is per process: with several workers, set `refresh_interval`
+    so a filter also picks up what other workers recommended since its
+    last load; without it a user switching workers can see repeats until
+    the filter rotates or is evicted.
+    Each generation is sized for twice the books the user saw in the
+    generation before it (the whole window, at warm-up), so light users
+    cost SEEN_FILTER_MIN_BITS per generation and heavy ones stay near
+    SEEN_FALSE_POSITIVE.
+    """
+
+    def __init__(self, window: float = SEEN_WINDOW, false_positive: float = SEEN_FALSE_POSITIVE,
+                 hashes: int = SEEN_FILTER_HASHES, min_bits: int = SEEN_FILTER_MIN_BITS,
+                 max_bits: int = SEEN_FILTER_MAX_BITS, max_users: int = SEEN_MAX_USERS,
+                 refresh_interval: float = None, refresh_overlap: float = SEEN_REFRESH_OVERLAP):
+        self.half_window = window / 2
+        self.window = window
+        self.bits_per_book = -math.log(false_positive) / math.log(2) ** 2
+        self.hashes = hashes
+        self.min_bits = min_bits
+        self.max_bits = max_bits
+        self.max_users = max_users
+        self.refresh_interval = refresh_interval
+        self.refresh_overlap = refresh_overlap
+        self._filters = OrderedDict()
+        self._loading = {}
+
+    def bits_for(self, books: int):
+        return min(self.max_bits, max(self.min_bits, math.ceil(books * self.bits_per_book)))
+
+    def _filter(self, user_id: int):
+        now = time.time()
+        seen = self._filters.get(user_id)
+        if seen is None:
+            seen = self._filters[user_id] = SeenFilter(self.min_bits, self.hashes, now)
+            if len(self._filters) > self.max_users:
+                self._filters.popitem(last=False)
+        else:
+            self._filters.move_to_end(user_id)
+            seen.rotate(now, self.half_window, self.bits_for(2 * seen.count))
+        return seen
+
+    async def ensure_loaded(self, user_id: int):
+        seen = self._filter(user_id)
+        if seen.loaded:
+            if self.refresh_interval is None or time.time() - seen.refreshed_at < self.refresh_interval:
+                return seen
+            load = self._refresh
+        else:
+            load = self._load
+        task = self._loading.get(user_id)
+        if task is None:
+            task = self._loading[user_id] = asyncio.ensure_future(load(user_id, seen))
+            task.add_done_callback(lambda _: self._loading.pop(user_id, None))
+        await asyncio.shield(task)
+        return seen
+
+    async def _load(self, user_id: int, seen: SeenFilter):
+        started = time.time()
+        since = datetime.now() - timedelta(seconds=self.window)
+        rows = await db.fetch("recently_seen_books", user_id, since)
+        seen.reserve(self.bits_for(2 * len(rows)))
+        for row in rows:
+            seen.add(row['book_id'])
+        seen.refreshed_at = started
+        seen.loaded = True
+
+    async def _refresh(self, user_id: int, seen: SeenFilter):
+        """Add what was recommended or saved since the last load, on any worker."""
+        started = time.time()
+        since = datetime.fromtimestamp(seen.refreshed_at - self.refresh_overlap)
+        for row in await db.fetch("seen_books_since", user_id, since):
+            seen.add(row['book_id'])
+        seen.refreshed_at = started
+
+    def add(self, user_id: int, book_id: int):
+        self._filter(user_id).add(book_id)
+
+    def excluder(self, user_id: int):
+        """An O(1) `book_id -> bool` predicate for the samplers."""
+        return self._filter(user_id).__contains__
@@ -0,0 +1,135 @@
+"""Rebuild the user_stats counters from the base tables.
+
+The counters are maintained by triggers (migration 3); this job repairs any
+drift, e.g. after manual edits or a restore. Run once with
+
+    python stats.py
+
+or set STATS_RECONCILE_INTERVAL to have the bot run it periodically.
+
+Users are recounted in batches of STATS_RECONCILE_BATCH, without locking
+the base tables. A batch adds each user's drift, measured in one snapshot,
+to the counter's latest value: a write committed after that snapshot is
+absent from both the recount and the snapshot counter, so its trigger
+increment survives. Only drifted rows are updated, and so locked. A
+multi-user write (e.g. a Recommendations flush) can still hold one of
+them while waiting for another, so a batch statement waits at most
+STATS_RECONCILE_LOCK_TIMEOUT_MS for a row lock, well under Postgres's
+deadlock_timeout, then backs off and retries: the reconciler gives way and
+the writer is never the deadlock victim. Every recount is an index lookup
+per user, so batches stay well inside DB_COMMAND_TIMEOUT.
+"""
+import asyncio
+import logging
+import os
+import time
+
+import asyncpg
+
+import db
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL = float(os.getenv("STATS_RECONCILE_INTERVAL", "0"))
+RECONCILE_BATCH = int(os.getenv("STATS_RECONCILE_BATCH", "100"))
+RECONCILE_LOCK_TIMEOUT_MS = int(os.getenv("STATS_RECONCILE_LOCK_TIMEOUT_MS", "200"))
+RECONCILE_ATTEMPTS = 10
+
+BATCH_USERS_SQL = "SELECT user_id FROM Users WHERE user_id > $1 ORDER BY user_id LIMIT $2"
+
+# Zero rows for users without one, so the drift below always has a row to
+# land on; a trigger inserting the same row concurrently wins the conflict.
+ENSURE_ROWS_SQL = """
+    INSERT INTO user_stats (user_id)
+    SELECT user_id FROM Users WHERE user_id > $1 AND user_id <= $2
+    ON CONFLICT (user_id) DO NOTHING
+"""
+
+# `snap` and the recount share the statement's snapshot; `s` is re-read at
+# its latest version when a concurrent trigger updated it first.
+RECONCILE_SQL = """
+    UPDATE user_stats s SET
+        books_added = s.books_added + (c.books_added - snap.books_added),
+        recommendations_received =
+            s.recommendations_received + (c.recommendations_received - snap.recommendations_received),
+        reading_list_count = s.reading_list_count + (c.reading_list_count - snap.reading_list_count)
+    FROM user_stats snap
+    JOIN (
+        SELECT u.user_id,
+            (SELECT COUNT(*) FROM Books b WHERE b.user_id = u.user_id) AS books_added,
+            (SELECT COUNT(*) FROM Recommendations r WHERE r.user_id = u.user_id) AS recommendations_received,
+            (SELECT COUNT(*) FROM ReadingList rl WHERE rl.user_id = u.user_id) AS reading_list_count
+        FROM Users u
+        WHERE u.user_id > $1 AND u.user_id <= $2
+    ) c ON c.user_id = snap.user_id
+    WHERE s.user_id = snap.user_id
+      AND (snap.books_added, snap.recommendations_received, snap.reading_list_count)
+          IS DISTINCT FROM (c.books_added, c.recommendations_received, c.reading_list_count)
+"""
+
+
+async def _execute_yielding(conn, sql: str, *args):
+    """Run `sql` giving way to writers on lock waits; the status, or None if it never got its locks."""
+    for attempt in range(1, RECONCILE_ATTEMPTS + 1):
+        try:
+            async with conn.transaction():
+                await conn.execute(f"SET LOCAL lock_timeout = {RECONCILE_LOCK_TIMEOUT_MS}")
+                return await conn.execute(sql, *args)
+        except (asyncpg.LockNotAvailableError, asyncpg.DeadlockDetectedError):
+            await asyncio.sleep(0.05 * attempt)
+    return None
+
+
+async def reconcile_batch(conn, after: int, last: int):
+    """Recount users in (after, last]; returns the number of rows corrected."""
+    status = await _execute_yielding(conn, ENSURE_ROWS_SQL, after, last)
+    if status is not None:
+        status = await _execute_yielding(conn, RECONCILE_SQL, after, last)
+    if status is None:
+        logger.warning(f"Skipped reconciling users {after}..{last}: rows stayed locked")
+        return 0
+    return int(status.split()[-1])
+
+
+async def reconcile_user_stats(conn, batch_size: int = RECONCILE_BATCH):
+    """Recount every user's counters; returns the number of rows corrected."""
+    start = time.perf_counter()
+    corrected = 0
+    after = -2 ** 63
+    while True:
+        user_ids = await conn.fetch(BATCH_USERS_SQL, after, batch_size)
+        if not user_ids:
+            break
+        last = user_ids[-1]['user_id']
+        corrected += await reconcile_batch(conn, after, last)
+        after = last
+    await conn.execute("DELETE FROM user_stats WHERE user_id NOT IN (SELECT user_id FROM Users)")
+    logger.info(f"Reconciled user_stats: {corrected} rows corrected in {time.perf_counter() - start:.2f}s")
+    return corrected
+
+
+async def run_reconciler(interval: float = RECONCILE_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        # Its own connection, so a long run neither holds a pooled one nor hits its timeout.
+        try:
+            conn = await asyncpg.connect(**db.DB_CONFIG)
+            try:
+                await reconcile_user_stats(conn)
+            finally:
+                await conn.close()
+        except Exception as e:
+            logger.error(f"user_stats reconciliation failed: {e}")
+
+
+async def main():
+    conn = await asyncpg.connect(**db.DB_CONFIG)
+    try:
+        await reconcile_user_stats(conn)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+from contextlib import asynccontextmanager
+
+import pytest
+
+import db
+
+
+class StandInConnection:
+    """Records every call that succeeds.
+
+    `script(method, *outcomes)` decides the next calls to `method` in order:
+    an exception is raised, None lets the call through. `fail_when` raises
+    for every call whose arguments match.
+    """
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.calls = []
+        self._scripts = {}
+        self._conditions = {}
+
+    def script(self, method: str, *outcomes):
+        self._scripts.setdefault(method, []).extend(outcomes)
+
+    def fail_when(self, method: str, predicate, error):
+        self._conditions.setdefault(method, []).append((predicate, error))
+
+    def _call(self, method: str, *args):
+        script = self._scripts.get(method)
+        outcome = script.pop(0) if script else None
+        if outcome is not None:
+            raise outcome
+        for predicate, error in self._conditions.get(method, ()):
+            if predicate(*args):
+                raise error
+        self.calls.append((method, *args))
+
+    async def fetch(self, sql, *args):
+        self._call("fetch", sql, *args)
+        return self.rows
+
+    async def fetchrow(self, sql, *args):
+        self._call("fetchrow", sql, *args)
+        return self.rows[0] if self.rows else None
+
+    async def execute(self, sql, *args):
+        self._call("execute", sql, *args)
+        return "INSERT 0 1"
+
+    async def executemany(self, sql, rows):
+        self._call("executemany", sql, list(rows))
+
+    async def copy_records_to_table(self, table, records, columns):
+        self._call("copy_records_to_table", table, list(records), columns)
+
+
+class StandInPool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.acquired = 0
+        self.released = 0
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        self.acquired += 1
+        try:
+            yield self.conn
+        finally:
+            self.released += 1
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def conn():
+    return StandInConnection()
+
+
+@pytest.fixture
+def pool(conn):
+    pool = StandInPool(conn)
+    db.set_pool(pool)
+    yield pool
+    db.set_pool(None)
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+import db
+import metrics
+from books import Book
+
+
+def query_count(name: str):
+    series = metrics.QUERY_LATENCY._series.get((name,))
+    return series[2] if series else 0
+
+
+def test_fetch_books_runs_the_named_query_on_a_pooled_connection(pool, conn):
+    conn.rows = [(1, "Dune", "Frank Herbert", 1965, 5, "Fiction"), (2, "Emma", "Jane Austen", 1815, None, "Fiction")]
+    observed = query_count("user_books_after")
+
+    books = asyncio.run(db.fetch_books("user_books_after", 42, 0, 11))
+
+    assert conn.calls == [("fetch", db.QUERIES["user_books_after"], 42, 0, 11)]
+    assert all(isinstance(book, Book) for book in books)
+    assert [(book.book_id, book.title, book.rating, book.genre_name) for book in books] == [
+        (1, "Dune", 5, "Fiction"), (2, "Emma", None, "Fiction"),
+    ]
+    assert (pool.acquired, pool.released) == (1, 1)
+    assert query_count("user_books_after") == observed + 1
+
+
+def test_fetchrow_book_decodes_a_missing_row_to_none(pool, conn):
+    assert asyncio.run(db.fetchrow_book("random_book")) is None
+    assert conn.calls == [("fetchrow", db.QUERIES["random_book"])]
+
+
+def test_a_failing_query_is_timed_and_releases_its_connection(pool, conn):
+    conn.script("execute", ConnectionResetError("server closed the connection"))
+    observed = query_count("delete_book")
+
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(db.execute("delete_book", 1, 42))
+
+    assert (pool.acquired, pool.released) == (1, 1)
+    assert query_count("delete_book") == observed + 1
+
+
+def test_queries_need_a_pool():
+    db.set_pool(None)
+    with pytest.raises(RuntimeError):
+        db.get_pool()
@@ -0,0 +1,54 @@
+import random
+import re
+
+from books import Book
+from rendering import MESSAGE_LIMIT, format_book, render_books, render_page
+
+LINE = re.compile(r"📖 \*([^*]*)\* by ([^*]*) \(")
+
+
+def random_books(rng, count: int):
+    words = ("the", "war", "peace", "of", "an", "extraordinarily", "long", "chronicle", "ÿ", "日本")
+
+    def text(max_words: int):
+        return " ".join(rng.choice(words) for _ in range(rng.randint(1, max_words)))
+
+    return [
+        Book(book_id, text(rng.choice((3, 40, 800))), text(rng.choice((2, 20, 300))),
+             rng.randint(1500, 2025), rng.choice((None, 1, 5)), rng.choice(("Fiction", "Self-Help")))
+        for book_id in range(count)
+    ]
+
+
+def is_shortened(short: str, full: str):
+    return short == full or (short.endswith("…") and full.startswith(short[:-1]))
+
+
+def test_random_pages_fit_one_message_and_keep_every_book_whole():
+    rng = random.Random(0)
+    for _ in range(300):
+        books = random_books(rng, rng.randint(1, 25))
+        header = "Your books:"
+        text = render_page(header, books, with_genre=rng.random() < 0.5)
+
+        assert len(text) <= MESSAGE_LIMIT
+        assert text.startswith(header + "\n\n")
+        lines = text[len(header) + 2:].split("\n")
+        assert len(lines) == len(books)
+        for line, book in zip(lines, books):
+            # One balanced *title* entity per line, cut inside the title, never across it.
+            assert line.count("*") == 2
+            title, author = LINE.match(line).groups()
+            assert is_shortened(title, book.title)
+            assert is_shortened(author, book.author)
+
+
+def test_pages_that_fit_are_rendered_unchanged():
+    books = random_books(random.Random(1), 5)
+    for book in books:
+        book.title, book.author = book.title[:40], book.author[:20]
+
+    text = render_page("Your books:", books)
+
+    assert text == "Your books:\n\n" + "\n".join(format_book(book) for book in books)
+    assert render_books("Your books:", books) == [text]
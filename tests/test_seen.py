@@ -0,0 +1,66 @@
+import asyncio
+import random
+
+from seen import SeenFilter, SeenTracker
+
+
+def false_positive_rate(seen, book_ids):
+    return sum(book_id in seen for book_id in book_ids) / len(book_ids)
+
+
+def test_false_positive_rate_over_a_large_id_range():
+    tracker = SeenTracker()
+    added = range(1, 1001)
+    seen = SeenFilter(tracker.bits_for(len(added)), tracker.hashes, now=0)
+    for book_id in added:
+        seen.add(book_id)
+
+    assert all(book_id in seen for book_id in added)
+    # Neighbouring ids, ids congruent to the added ones modulo the filter
+    # size, and ids scattered over a large range must all stay near the target.
+    assert false_positive_rate(seen, range(1001, 101_001)) < 0.02
+    assert false_positive_rate(seen, [book_id + k * 8192 for k in range(1, 100) for book_id in added]) < 0.02
+    sample = random.Random(0).sample(range(1001, 10**12), 100_000)
+    assert false_positive_rate(seen, sample) < 0.02
+
+
+def test_rotation_sizes_the_next_generation_from_the_last_one():
+    tracker = SeenTracker(window=2)
+    seen = SeenFilter(tracker.min_bits, tracker.hashes, now=0)
+    for book_id in range(5000):
+        seen.add(book_id)
+    seen.rotate(1, tracker.half_window, tracker.bits_for(2 * seen.count))
+
+    assert len(seen.current) * 8 == tracker.max_bits
+    assert all(book_id in seen for book_id in range(5000))
+    seen.rotate(2, tracker.half_window, tracker.bits_for(2 * seen.count))
+    assert len(seen.current) * 8 == tracker.min_bits
+    assert false_positive_rate(seen, range(5000)) == 0
+
+
+def test_refresh_picks_up_books_seen_on_other_workers(monkeypatch):
+    history = {"recently_seen_books": [{"book_id": 1}], "seen_books_since": []}
+    queries = []
+
+    async def fetch(name, *args):
+        queries.append(name)
+        return history[name]
+
+    monkeypatch.setattr("db.fetch", fetch)
+
+    async def scenario():
+        single = SeenTracker()
+        workers = SeenTracker(refresh_interval=0)
+        await single.ensure_loaded(7)
+        await workers.ensure_loaded(7)
+        # Another worker recommends book 2 and it reaches the table.
+        history["seen_books_since"] = [{"book_id": 2}]
+        await single.ensure_loaded(7)
+        await workers.ensure_loaded(7)
+        return single.excluder(7), workers.excluder(7)
+
+    single, workers = asyncio.run(scenario())
+
+    assert queries == ["recently_seen_books", "recently_seen_books", "seen_books_since"]
+    assert single(1) and not single(2)
+    assert workers(1) and workers(2)
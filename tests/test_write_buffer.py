@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime
+
+import asyncpg
+
+import db
+from write_buffer import RecommendationWriter
+
+NOW = datetime(2024, 1, 1)
+
+
+def rows(*book_ids):
+    return [(book_id * 10, book_id, NOW) for book_id in book_ids]
+
+
+def written(conn):
+    """Every row that reached the stand-in, in order."""
+    result = []
+    for method, *args in conn.calls:
+        if method == "copy_records_to_table":
+            result += args[1]
+        elif method == "executemany":
+            result += args[1]
+        elif method == "execute":
+            result.append(tuple(args[1:]))
+    return result
+
+
+def flush(writer, batch):
+    flushed_users = []
+
+    async def on_flush(user_ids):
+        flushed_users.append(user_ids)
+
+    writer.on_flush = on_flush
+
+    async def run():
+        # flush() marks the batch done on the queue, as _run() would after collecting it.
+        for row in batch:
+            writer._queue.put_nowait(row)
+            writer._queue.get_nowait()
+        await writer.flush(batch)
+
+    asyncio.run(run())
+    return flushed_users
+
+
+def test_large_batches_are_copied_and_small_ones_use_executemany(pool, conn):
+    writer = RecommendationWriter(copy_threshold=3)
+    flush(writer, rows(1, 2, 3))
+    flush(writer, rows(4, 5))
+
+    assert [call[0] for call in conn.calls] == ["copy_records_to_table", "executemany"]
+    assert conn.calls[1][1] == db.QUERIES["save_recommendation"]
+    assert written(conn) == rows(1, 2, 3, 4, 5)
+    assert writer.flushed == 5 and writer.failed == 0
+
+
+def test_transient_errors_are_retried(pool, conn):
+    conn.script("executemany", ConnectionResetError("connection reset"), asyncio.TimeoutError())
+    writer = RecommendationWriter(retry_delay=0)
+
+    flushed_users = flush(writer, rows(1, 2))
+
+    assert written(conn) == rows(1, 2)
+    assert writer.retries == 2 and writer.flushed == 2 and writer.failed == 0
+    assert flushed_users == [{10, 20}]
+    assert pool.acquired == pool.released == 3
+
+
+def test_retries_give_up_after_max_retries(pool, conn):
+    conn.script("executemany", *(ConnectionResetError("connection reset") for _ in range(3)))
+    writer = RecommendationWriter(retry_delay=0, max_retries=2)
+
+    flushed_users = flush(writer, rows(1, 2))
+
+    assert written(conn) == []
+    assert writer.failed == 2 and writer.flushed == 0
+    assert flushed_users == []
+
+
+def test_a_rejected_batch_is_written_row_by_row(pool, conn):
+    conn.script("executemany", asyncpg.ForeignKeyViolationError("book 2 was deleted"))
+    conn.fail_when("execute", lambda sql, user_id, book_id, at: book_id == 2,
+                   asyncpg.ForeignKeyViolationError("book 2 was deleted"))
+    writer = RecommendationWriter()
+
+    flushed_users = flush(writer, rows(1, 2, 3))
+
+    assert written(conn) == rows(1, 3)
+    assert writer.flushed == 2 and writer.failed == 1
+    assert flushed_users == [{10, 20, 30}]
+
+
+def test_a_retry_after_a_partial_row_by_row_write_skips_the_written_rows(pool, conn):
+    conn.script("copy_records_to_table", ValueError("invalid input for query argument"))
+    conn.script("execute", None, ConnectionResetError("connection reset"))
+    writer = RecommendationWriter(copy_threshold=3, retry_delay=0)
+
+    flush(writer, rows(1, 2, 3))
+
+    # Row 1 went in on its own, then the connection dropped; the retry sends
+    # only rows 2 and 3, as a batch again.
+    assert written(conn) == rows(1, 2, 3)
+    assert [call[0] for call in conn.calls] == ["execute", "executemany"]
+    assert writer.flushed == 3 and writer.retries == 1 and writer.failed == 0
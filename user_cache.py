@@ -0,0 +1,216 @@
+"""Read-through cache for per-user lists: My Books, My Reading List, My Stats.
+
+Results are kept per user in an LRU bounded by an estimate of their size
+in bytes (USER_CACHE_MAX_BYTES) and expire after USER_CACHE_TTL seconds.
+The handlers that change a user's data call invalidate(), which drops the
+user's entries here and publishes the user id on a Postgres NOTIFY channel;
+every other process LISTENs on it and drops them too. The cache is only
+consulted while that channel is up, so a worker that may have missed a
+notification reads from the database instead.
+
+Changes a user cannot see coming (another user deleting or renaming a book
+that sits in this user's reading list) are picked up when the entry expires.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+
+import asyncpg
+
+from books import Book
+import db
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+USER_CACHE_MAX_BYTES = int(os.getenv("USER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+USER_CACHE_CHANNEL = os.getenv("USER_CACHE_CHANNEL", "user_cache")
+# NOTIFY payloads must stay under 8000 bytes.
+NOTIFY_BATCH = 400
+LISTEN_CHECK_INTERVAL = 30.0
+
+_MISSING = object()
+
+
+def estimate_size(value):
+    """Rough retained size in bytes of a query result (Books, Records, lists, tuples, dicts, scalars)."""
+    if isinstance(value, Book):
+        return sys.getsizeof(value) + sum(sys.getsizeof(getattr(value, name)) for name in Book.__slots__)
+    if isinstance(value, asyncpg.Record):
+        return sys.getsizeof(value) + sum(sys.getsizeof(field) for field in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(k) + estimate_size(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+class UserCache:
+    def __init__(self, ttl: float = USER_CACHE_TTL, max_bytes: int = USER_CACHE_MAX_BYTES,
+                 channel: str = USER_CACHE_CHANNEL):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.channel = channel
+        self.origin = uuid.uuid4().hex[:12]
+        self.listening = False
+        # user_id -> {key: (value, cached_at, size)}
+        self._users = OrderedDict()
+        self._sizes = {}
+        self.bytes = 0
+        # Bumped by every invalidation; a load that straddles one is not stored.
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "bypassed": self.bypassed,
+            "users": len(self._users),
+            "bytes": self.bytes,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "remote_invalidations": self.remote_invalidations,
+            "listening": int(self.listening),
+        }
+
+    def _cached(self, user_id: int, key):
+        entries = self._users.get(user_id)
+        if entries is None:
+            return _MISSING
+        entry = entries.get(key)
+        if entry is None:
+            return _MISSING
+        value, cached_at, size = entry
+        if time.monotonic() - cached_at >= self.ttl:
+            del entries[key]
+            self._resize(user_id, -size)
+            return _MISSING
+        self._users.move_to_end(user_id)
+        return value
+
+    def _resize(self, user_id: int, delta: int):
+        self.bytes += delta
+        size = self._sizes[user_id] + delta
+        if self._users[user_id]:
+            self._sizes[user_id] = size
+        else:
+            del self._users[user_id], self._sizes[user_id]
+
+    def _remember(self, user_id: int, key, value):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        entries = self._users.get(user_id)
+        if entries is None:
+            entries = self._users[user_id] = {}
+            self._sizes[user_id] = 0
+        previous = entries.get(key)
+        entries[key] = (value, time.monotonic(), size)
+        self._users.move_to_end(user_id)
+        self._resize(user_id, size - (previous[2] if previous else 0))
+        while self.bytes > self.max_bytes:
+            evicted, _ = self._users.popitem(last=False)
+            self.bytes -= self._sizes.pop(evicted)
+            self.evictions += 1
+
+    async def get(self, user_id: int, key, load):
+        """`await load()`, served from the cache under (user_id, key) when possible."""
+        if not self.listening:
+            self.bypassed += 1
+            return await load()
+        value = self._cached(user_id, key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        generation = self._generation
+        value = await load()
+        if generation == self._generation and self.listening:
+            self._remember(user_id, key, value)
+        return value
+
+    def _drop(self, user_ids, names=None):
+        self._generation += 1
+        for user_id in user_ids:
+            entries = self._users.get(user_id)
+            if entries is None:
+                continue
+            if names is None:
+                del self._users[user_id]
+                self.bytes -= self._sizes.pop(user_id)
+                continue
+            for key in [key for key in entries if key[0] in names]:
+                self._resize(user_id, -entries.pop(key)[2])
+                if user_id not in self._users:
+                    break
+
+    async def invalidate(self, *user_ids: int, names=None):
+        """Drop the users' cached results (only keys whose first element is in `names`, if given), here and in every other process."""
+        self.invalidations += 1
+        self._drop(user_ids, names)
+        names = sorted(names) if names is not None else None
+        for start in range(0, len(user_ids), NOTIFY_BATCH):
+            payload = json.dumps({"origin": self.origin, "users": user_ids[start:start + NOTIFY_BATCH], "names": names})
+            try:
+                await db.execute("notify", self.channel, payload)
+            except Exception as e:
+                logger.error(f"Publishing user cache invalidation failed: {e}")
+
+    def clear(self):
+        self._generation += 1
+        self._users.clear()
+        self._sizes.clear()
+        self.bytes = 0
+
+    def _on_notify(self, conn, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+            if message["origin"] == self.origin:
+                return
+            self.remote_invalidations += 1
+            self._drop(message["users"], message["names"])
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Ignoring malformed user cache notification {payload!r}: {e}")
+
+    async def run(self):
+        """Listen for invalidations from other processes, reconnecting as needed."""
+        delay = 1.0
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(**db.DB_CONFIG)
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda _: lost.set())
+                await conn.add_listener(self.channel, self._on_notify)
+                # Anything cached before now may have missed a notification.
+                self.clear()
+                self.listening = True
+                delay = 1.0
+                logger.info(f"User cache listening on {self.channel!r}")
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), LISTEN_CHECK_INTERVAL)
+                    except asyncio.TimeoutError:
+                        await conn.execute("SELECT 1", timeout=LISTEN_CHECK_INTERVAL)
+                logger.warning("User cache listener connection lost")
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                logger.warning(f"User cache listener failed: {e}; retrying in {delay:.0f}s")
+            finally:
+                self.listening = False
+                if conn is not None and not conn.is_closed():
+                    conn.terminate()
+            await asyncio.sleep(delay)
+            delay = min(60.0, delay * 2)
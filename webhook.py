@@ -0,0 +1,128 @@
+"""Webhook transport: an aiohttp server that feeds Telegram updates to the Dispatcher.
+
+Several worker processes can bind the same port (SO_REUSEPORT) and the
+kernel spreads connections between them. Try it locally with a recorded
+update:
+
+    curl -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" \\
+         -H "Content-Type: application/json" -d @update.json localhost:8080/webhook
+"""
+import asyncio
+import hmac
+import logging
+import os
+import re
+import signal
+
+from aiogram import types
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Public base URL Telegram should call, e.g. https://bot.example.com; unset to manage the webhook yourself.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "100"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# What Telegram accepts as a secret_token.
+SECRET_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+
+def check_secret(secret: str = WEBHOOK_SECRET):
+    """Refuse to serve without a secret: anyone who finds the URL could post forged updates."""
+    if not secret:
+        raise RuntimeError("WEBHOOK_SECRET is not set; refusing to accept unauthenticated webhook updates")
+    if not SECRET_PATTERN.fullmatch(secret):
+        raise RuntimeError("WEBHOOK_SECRET must be 1-256 characters of A-Z, a-z, 0-9, _ and -")
+
+
+class UpdateHandler:
+    """Accepts update POSTs and processes them in the background.
+
+    At most `max_concurrency` updates are in flight per process; beyond
+    that the request waits for a slot, which pushes back on Telegram.
+    """
+
+    def __init__(self, dp, bot, secret: str = WEBHOOK_SECRET, max_concurrency: int = WEBHOOK_MAX_CONCURRENCY):
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks = set()
+
+    @property
+    def in_flight(self):
+        return len(self._tasks)
+
+    async def __call__(self, request: web.Request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        try:
+            update = types.Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError as e:
+            logger.warning(f"Rejected malformed update: {e}")
+            return web.Response(status=400)
+
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: types.Update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            logger.exception(f"Failed to process update {update.update_id}")
+        finally:
+            self._slots.release()
+
+    async def drain(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def build_app(dp, bot, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET,
+              max_concurrency: int = WEBHOOK_MAX_CONCURRENCY):
+    check_secret(secret)
+    handler = UpdateHandler(dp, bot, secret, max_concurrency)
+    app = web.Application()
+    app["update_handler"] = handler
+    app.router.add_post(path, handler)
+    app.router.add_get("/healthz", lambda request: web.json_response({"in_flight": handler.in_flight}))
+    return app
+
+
+async def register_webhook(bot, url: str = WEBHOOK_URL, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET):
+    if not url:
+        return
+    await bot.set_webhook(url.rstrip("/") + path, secret_token=secret)
+    logger.info(f"Webhook registered at {url.rstrip('/') + path}")
+
+
+async def serve(dp, bot, startup, shutdown, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT):
+    """Run one webhook worker until SIGINT/SIGTERM."""
+    # Handle signals from the start, so one arriving during startup still shuts down cleanly.
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await startup()
+    app = build_app(dp, bot)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port, reuse_port=True)
+    await site.start()
+    logger.info(f"Webhook worker {os.getpid()} listening on {host}:{port}{WEBHOOK_PATH}")
+    try:
+        await stop.wait()
+    finally:
+        await site.stop()
+        await app["update_handler"].drain()
+        await runner.cleanup()
+        await shutdown()
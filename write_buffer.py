@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+
+import asyncpg
+
+import db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("REC_BUFFER_BATCH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.getenv("REC_BUFFER_FLUSH_INTERVAL", "1.0"))
+MAX_QUEUE = int(os.getenv("REC_BUFFER_MAX_QUEUE", "10000"))
+COPY_THRESHOLD = int(os.getenv("REC_BUFFER_COPY_THRESHOLD", "100"))
+MAX_RETRIES = int(os.getenv("REC_BUFFER_MAX_RETRIES", "5"))
+RETRY_DELAY = float(os.getenv("REC_BUFFER_RETRY_DELAY", "0.5"))
+
+# Rows that can never be written, e.g. a book deleted since it was recommended.
+# ValueError covers asyncpg's client-side encoding errors.
+DATA_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError, ValueError)
+# The database is unreachable, restarting or out of connections; worth retrying.
+TRANSIENT_ERRORS = (OSError, asyncio.TimeoutError, asyncpg.InterfaceError, asyncpg.PostgresConnectionError,
+                    asyncpg.InsufficientResourcesError, asyncpg.OperatorInterventionError)
+
+
+class RecommendationWriter:
+    """Write-behind buffer for Recommendations rows.
+
+    Events are queued by the handlers and flushed in batches by a background
+    task, by size or by time. A full queue makes put() wait (backpressure).
+    After a successful flush `on_flush` is awaited with the batch's user ids.
+
+    Connection errors and timeouts are retried with exponential backoff
+    (the queue fills up meanwhile and put() starts waiting). A batch the
+    database rejects for its data is written row by row instead, so only
+    the offending rows are dropped.
+    """
+
+    columns = ("user_id", "book_id", "recommended_at")
+
+    def __init__(self, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL,
+                 max_queue: int = MAX_QUEUE, copy_threshold: int = COPY_THRESHOLD,
+                 max_retries: int = MAX_RETRIES, retry_delay: float = RETRY_DELAY, on_flush=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.copy_threshold = copy_threshold
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.on_flush = on_flush
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self.flushed = 0
+        self.failed = 0
+        self.retries = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def metrics(self):
+        return {
+            "queue_depth": self.depth,
+            "flushed_rows": self.flushed,
+            "failed_rows": self.failed,
+            "retries": self.retries,
+            "flushes": self.flushes,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+        }
+
+    async def put(self, user_id: int, book_id: int):
+        await self._queue.put((user_id, book_id, datetime.now()))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            await self.flush(batch)
+
+    async def _write(self, rows):
+        """Insert `rows`, removing each one from the list once it is written or skipped."""
+        async with db.acquire() as conn:
+            try:
+                if len(rows) >= self.copy_threshold:
+                    await conn.copy_records_to_table("recommendations", records=rows, columns=self.columns)
+                else:
+                    await conn.executemany(db.QUERIES["save_recommendation"], rows)
+            except DATA_ERRORS as e:
+                logger.warning(f"Recommendation batch of {len(rows)} rows rejected ({e}), inserting row by row")
+            else:
+                self.flushed += len(rows)
+                rows.clear()
+                return
+            done = 0
+            try:
+                for row in rows:
+                    try:
+                        await conn.execute(db.QUERIES["save_recommendation"], *row)
+                    except DATA_ERRORS as e:
+                        self.failed += 1
+                        logger.error(f"Dropped recommendation {row}: {e}")
+                    else:
+                        self.flushed += 1
+                    done += 1
+            finally:
+                del rows[:done]
+
+    async def flush(self, batch):
+        start = time.perf_counter()
+        rows = list(batch)
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    await self._write(rows)
+                    break
+                except TRANSIENT_ERRORS as e:
+                    if attempt == self.max_retries:
+                        raise
+                    delay = min(30.0, self.retry_delay * 2 ** attempt)
+                    self.retries += 1
+                    logger.warning(f"Recommendation flush of {len(rows)} rows failed ({e!r}), retrying in {delay}s")
+                    await asyncio.sleep(delay)
+        except Exception as e:
+            self.failed += len(rows)
+            logger.error(f"Recommendation flush of {len(rows)} rows failed: {e!r}")
+            return
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+            self.flushes += 1
+            elapsed = time.perf_counter() - start
+            metrics.observe_query("save_recommendation_batch", elapsed)
+            self.last_flush_ms = elapsed * 1000
+            self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+        if self.on_flush is not None:
+            try:
+                await self.on_flush({user_id for user_id, _, _ in batch})
+            except Exception as e:
+                logger.error(f"Recommendation flush callback failed: {e}")
+
+    async def close(self, timeout: float = 10.0):
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Recommendation buffer did not drain within {timeout}s")
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        batch = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+            if len(batch) >= self.batch_size:
+                await self.flush(batch)
+                batch = []
+        if batch:
+            await self.flush(batch)
+        logger.info(f"Recommendation buffer closed: {self.metrics()}")